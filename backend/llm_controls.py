@@ -0,0 +1,264 @@
+"""
+Upstream LLM call controls: rate limiting, request hedging and circuit breaking.
+
+Plain state machines with no I/O, shared by every job in the process through
+LlmClientPool in server.py. Defaults come from the environment.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "120"))
+LLM_BURST = int(os.environ.get("LLM_BURST", "10"))
+RATE_LIMIT_TERMS = ["rate limit", "rate_limit", "quota", "too many requests", "429"]
+
+
+def _is_rate_limit_error(exc: BaseException) -> bool:
+    """True if an upstream exception is a rate-limit rejection. Response bodies are never
+    inspected: market copy routinely contains "$429,000" or "quota"."""
+    response = getattr(exc, "response", None)
+    status_code = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status_code is not None:
+        return status_code == 429
+    if "ratelimit" in type(exc).__name__.lower():
+        return True
+    message = str(exc).lower()
+    return any(term in message for term in RATE_LIMIT_TERMS)
+
+
+class AdaptiveRateLimiter:
+    """Process-wide token bucket with an AIMD concurrency limit.
+
+    Every upstream call takes one token (refilled at `rate` per second up to `burst`)
+    and one concurrency slot. Rate-limit signals halve both the concurrency limit and
+    the refill rate; each success grows them back additively toward their maximums.
+    Waiters queue on one condition, and wait time is tracked per stage.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE, burst: int = LLM_BURST,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, min_concurrency: int = 1):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self._refilled = time.monotonic()
+        self._cond = asyncio.Condition()
+        self.stage_waits: Dict[str, Dict[str, float]] = {}
+        self.stats = {"acquired": 0, "rate_limited": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    async def acquire(self, stage: str = "adhoc"):
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            async with self._cond:
+                while True:
+                    self._refill()
+                    if self.in_flight < int(self.limit) and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        break
+                    if self.in_flight >= int(self.limit):
+                        await self._cond.wait()
+                    else:
+                        try:
+                            await asyncio.wait_for(self._cond.wait(), (1 - self.tokens) / self.rate)
+                        except asyncio.TimeoutError:
+                            pass
+        finally:
+            self.waiting -= 1
+        waited_ms = (time.perf_counter() - started) * 1000
+        entry = self.stage_waits.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += waited_ms
+        entry["max_ms"] = max(entry["max_ms"], waited_ms)
+        self.stats["acquired"] += 1
+
+    async def release(self, outcome: str = "ok"):
+        async with self._cond:
+            self.in_flight -= 1
+            if outcome == "rate_limited":
+                self.stats["rate_limited"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, 0.0)
+            elif outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "concurrency_limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": round(self.rate * 60, 1),
+            "max_requests_per_minute": round(self.max_rate * 60, 1),
+            "in_flight": self.in_flight,
+            "queued": self.waiting,
+            "stage_waits": {
+                stage: {
+                    "count": int(w["count"]),
+                    "avg_ms": round(w["total_ms"] / w["count"], 1) if w["count"] else 0.0,
+                    "max_ms": round(w["max_ms"], 1),
+                }
+                for stage, w in self.stage_waits.items()
+            },
+        }
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+LLM_HEDGING_ENABLED = os.environ.get("LLM_HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", "0.10"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+
+
+class HedgingPolicy:
+    """Decides when a slow LLM call gets a duplicate request.
+
+    Keeps a rolling window of successful call latencies per stage, measured from when the
+    request was sent (limiter queue wait excluded). A hedge fires once a sent call has run
+    longer than the stage's `percentile` latency, as long as hedges stay within `budget`
+    (fraction of hedge-eligible calls). Stages with fewer than `min_samples` observations
+    are never hedged.
+    """
+
+    def __init__(self, enabled: bool = LLM_HEDGING_ENABLED, percentile: float = LLM_HEDGE_PERCENTILE,
+                 budget: float = LLM_HEDGE_BUDGET, min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 window: int = LLM_HEDGE_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies: Dict[str, deque] = {}
+        self.stats = {"calls": 0, "fired": 0, "won": 0, "denied_budget": 0, "denied_queued": 0}
+
+    def record(self, stage: str, seconds: float):
+        self._latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        samples = self._latencies.get(stage)
+        if not self.enabled or not samples or len(samples) < self.min_samples:
+            return None
+        return _percentile(sorted(samples), self.percentile)
+
+    def try_acquire(self) -> bool:
+        if self.stats["fired"] + 1 > self.budget * self.stats["calls"]:
+            self.stats["denied_budget"] += 1
+            return False
+        self.stats["fired"] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            **self.stats,
+            "fired_rate": round(self.stats["fired"] / self.stats["calls"], 3) if self.stats["calls"] else 0.0,
+            "thresholds_ms": {
+                stage: round(delay * 1000)
+                for stage in self._latencies
+                if (delay := self.hedge_delay(stage)) is not None
+            },
+        }
+
+
+# Circuit breaker
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around the upstream LLM.
+
+    After `failure_threshold` consecutive failed attempts the breaker opens and callers
+    get the fallback immediately. Once `reset_seconds` have passed it goes half-open and
+    lets `half_open_probes` calls through: a success closes it, a failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS, half_open_probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_opened: Optional[datetime] = None
+        self.probes_in_flight = 0
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.last_opened = datetime.utcnow()
+        self.probes_in_flight = 0
+        self.stats["opened"] += 1
+        logging.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+
+    def allow_request(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.stats["short_circuited"] += 1
+                return False
+            self.state = "half_open"
+            self.probes_in_flight = 0
+        if self.state == "half_open":
+            if self.probes_in_flight >= self.half_open_probes:
+                self.stats["short_circuited"] += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record_success(self):
+        if self.state == "half_open":
+            logging.info("LLM circuit closed after successful probe")
+        self.state = "closed"
+        self.failures = 0
+        self.probes_in_flight = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self._open()
+
+    def abandon(self):
+        """Release a half-open probe slot for a call that was cancelled before finishing."""
+        if self.state == "half_open":
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == "open":
+            retry_in = max(0.0, round(self.reset_seconds - (time.monotonic() - self.opened_at), 1))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": retry_in,
+            "last_opened": self.last_opened.isoformat() if self.last_opened else None,
+            **self.stats,
+        }
@@ -0,0 +1,46 @@
+"""
+Prompt templates: text files under backend/prompts compiled once at import.
+
+Each template is split into literal and field segments up front, so rendering is a
+single join, and is versioned by a hash of its text so stored results can record
+which prompt produced them.
+"""
+
+import hashlib
+import string
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+class PromptTemplate:
+    """A prompt file compiled once into literal/field segments, versioned by content hash."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        self._parts = [(literal, field) for literal, field, _, _ in string.Formatter().parse(text)]
+        self.fields = {field for _, field in self._parts if field}
+
+    def render(self, **values: Any) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' missing values: {sorted(missing)}")
+        return "".join(literal + (str(values[field]) if field else "") for literal, field in self._parts)
+
+
+class PromptRegistry:
+    """All *.txt prompt templates in a directory, loaded when constructed."""
+
+    def __init__(self, directory: Path):
+        self.templates = {path.stem: PromptTemplate(path.stem, path.read_text(encoding="utf-8")) for path in sorted(directory.glob("*.txt"))}
+
+    def render(self, name: str, **values: Any) -> str:
+        return self.templates[name].render(**values)
+
+    def version(self, name: str) -> Optional[str]:
+        template = self.templates.get(name)
+        return template.version if template else None
+
+    def versions(self) -> Dict[str, str]:
+        return {name: template.version for name, template in self.templates.items()}
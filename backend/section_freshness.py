@@ -0,0 +1,45 @@
+"""
+Per-section freshness for stored market_intelligence analyses.
+
+Each section of an analysis expires on its own TTL, counted from the section's entry in
+section_updated_at. A section is also stale when its stored result is not valid (a
+fallback, or produced by an older prompt version), which the caller decides through
+an `is_valid(section, result)` callback.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+
+def section_freshness(analysis: Dict[str, Any], ttl_days: Dict[str, float],
+                      is_valid: Callable[[str, Any], bool], now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Per-section updated_at, expiry and staleness. Documents written before section timestamps
+    existed fall back to the document's created_at."""
+    now = now or datetime.utcnow()
+    stamps = analysis.get("section_updated_at") or {}
+    freshness = {}
+    for section, days in ttl_days.items():
+        updated_at = stamps.get(section) or analysis.get("created_at") or now
+        expires_at = updated_at + timedelta(days=days)
+        freshness[section] = {
+            "updated_at": updated_at,
+            "ttl_days": days,
+            "expires_at": expires_at,
+            "stale": expires_at <= now or not is_valid(section, analysis.get(section)),
+        }
+    return freshness
+
+
+def stale_sections(analysis: Optional[Dict[str, Any]], ttl_days: Dict[str, float],
+                   is_valid: Callable[[str, Any], bool], lead_seconds: float = 0,
+                   now: Optional[datetime] = None) -> List[str]:
+    """Sections that are stale now, or will be within `lead_seconds`. Every section is stale
+    when there is no analysis yet."""
+    if not analysis:
+        return list(ttl_days)
+    now = now or datetime.utcnow()
+    horizon = now + timedelta(seconds=lead_seconds)
+    return [
+        section for section, info in section_freshness(analysis, ttl_days, is_valid, now).items()
+        if info["stale"] or info["expires_at"] <= horizon
+    ]
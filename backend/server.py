@@ -1,25 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, validator, EmailStr
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Awaitable, NamedTuple
 import uuid
 from datetime import datetime, timedelta
 import re
 import asyncio
+import contextvars
+import socket
+import time
+import random
+import math
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from geopy.geocoders import Nominatim
 import json
+import hashlib
+from collections import OrderedDict, Counter, deque
 from emergentintegrations.llm.chat import LlmChat, UserMessage
+try:
+    # The completion client LlmChat is built on; used directly for streamed calls
+    from litellm import acompletion
+except ImportError:
+    acompletion = None
+from llm_controls import AdaptiveRateLimiter, CircuitBreaker, HedgingPolicy, _is_rate_limit_error, _percentile
+from prompt_templates import PromptRegistry
+from section_freshness import section_freshness, stale_sections
+from zip_gazetteer import ZipGazetteer
+from zip_spatial import ZipSpatialIndex
 import jwt
 from passlib.context import CryptContext
 from passlib.hash import bcrypt
@@ -37,6 +57,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
@@ -128,6 +149,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return user
 
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[dict]:
+    """The signed-in user if a valid token was sent, otherwise None"""
+    if not credentials:
+        return None
+    try:
+        return await get_current_user(credentials)
+    except HTTPException:
+        return None
+
 async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict:
     if current_user.get("role") != "super_admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
@@ -142,6 +172,25 @@ class ZipAnalysisRequest(BaseModel):
             raise ValueError('Invalid ZIP code format')
         return v.strip()
 
+class ZipBatchRequest(BaseModel):
+    zip_codes: List[str]
+    concurrency: Optional[int] = None
+
+    @validator('zip_codes')
+    def validate_zip_codes(cls, v):
+        cleaned = []
+        for z in v:
+            z = z.strip()
+            if not re.match(r'^\d{5}(-\d{4})?$', z):
+                raise ValueError(f'Invalid ZIP code format: {z}')
+            if z not in cleaned:
+                cleaned.append(z)
+        if not cleaned:
+            raise ValueError('At least one ZIP code is required')
+        if len(cleaned) > 1000:
+            raise ValueError('At most 1000 ZIP codes per batch')
+        return cleaned
+
 class MarketIntelligence(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     zip_code: str
@@ -151,25 +200,736 @@ class MarketIntelligence(BaseModel):
     hidden_listings: Dict[str, Any]
     market_hooks: Dict[str, Any]
     content_assets: Dict[str, Any]
+    section_updated_at: Dict[str, datetime] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 # Focus-mode task plan: add Content Assets
 TASK_ORDER = ["location", "buyer_migration", "seo_social_trends", "content_strategy", "content_assets"]
 TASK_PERCENT = {"location": 15, "buyer_migration": 40, "seo_social_trends": 70, "content_strategy": 90, "content_assets": 100}
+# Stage graph: each task lists the tasks whose outputs it consumes
+TASK_INPUTS = {
+    "location": [],
+    "buyer_migration": ["location"],
+    "seo_social_trends": ["location"],
+    "content_strategy": ["location"],
+    "content_assets": ["location"],
+}
+# Share of overall_percent each task contributes once done (sums to 100, matches TASK_PERCENT cumulatively)
+TASK_WEIGHT = {
+    tid: TASK_PERCENT[tid] - (TASK_PERCENT[TASK_ORDER[i - 1]] if i else 0)
+    for i, tid in enumerate(TASK_ORDER)
+}
+
+# Job deadlines: set once per job, inherited by every stage task through the context
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", "900"))
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get("LLM_CALL_TIMEOUT_SECONDS", "240"))
+_job_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("job_deadline", default=None)
+
+class StageTimeout(Exception):
+    """Raised when analysis stages run out of the job's deadline budget."""
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left before the current job's deadline, or None outside a job."""
+    deadline = _job_deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+async def _within_deadline(awaitable: Awaitable[Any]) -> Any:
+    remaining = remaining_budget()
+    if remaining is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, timeout=remaining)
+
+# LLM client pool
+LLM_SYSTEM_MESSAGE = (
+    "You are an expert real estate market analyst. Provide comprehensive, data-driven "
+    "insights based on the user's requests. Always be specific, actionable, and professional."
+)
+LLM_STREAMING_ENABLED = os.environ.get("LLM_STREAMING_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_API_BASE = os.environ.get("LLM_API_BASE")
+
+class StreamedResponse(NamedTuple):
+    text: str
+    usage: Any
+
+class LlmClientPool:
+    """Process-wide gateway for upstream LLM calls.
+
+    Each call is a stateless single-turn chat (fresh session, no carried history), so
+    unrelated prompts never inflate each other's token usage. The underlying HTTP client
+    is shared by the provider SDK, keeping connections alive across calls, and the
+    AdaptiveRateLimiter paces and bounds requests across every job in the process.
+
+    Calls given an `on_partial` callback stream tokens from the litellm completion client
+    underneath LlmChat and pass it the text so far after every chunk. Without litellm, or
+    with LLM_STREAMING_ENABLED off, they fall back to a single LlmChat round trip.
+    """
+
+    def __init__(self, api_key: Optional[str], provider: str = "openai", model: str = "gpt-5",
+                 limiter: Optional[AdaptiveRateLimiter] = None, hedging: Optional[HedgingPolicy] = None):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.hedging = hedging or HedgingPolicy()
+        self.streaming = LLM_STREAMING_ENABLED and acompletion is not None
+        if LLM_STREAMING_ENABLED and acompletion is None:
+            logging.warning("litellm is not installed; LLM calls will not stream")
+        self.stats = {"calls": 0, "streamed": 0, "in_flight": 0, "prompt_chars": 0, "setup_ms_total": 0.0, "call_ms_total": 0.0}
+
+    def _new_chat(self, system_message: str) -> LlmChat:
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=f"zipintel-{uuid.uuid4()}",
+            system_message=system_message,
+        ).with_model(self.provider, self.model)
+
+    async def _stream(self, prompt: str, system_message: str, on_partial: Callable[[str], Awaitable[None]]) -> StreamedResponse:
+        extra = {"api_base": LLM_API_BASE} if LLM_API_BASE else {}
+        stream = await acompletion(
+            model=f"{self.provider}/{self.model}",
+            messages=[{"role": "system", "content": system_message}, {"role": "user", "content": prompt}],
+            api_key=self.api_key,
+            stream=True,
+            stream_options={"include_usage": True},
+            **extra,
+        )
+        text, usage = "", None
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                text += delta
+                await on_partial(text)
+        self.stats["streamed"] += 1
+        return StreamedResponse(text, usage)
+
+    async def send(self, prompt: str, stage: str = "adhoc", system_message: str = LLM_SYSTEM_MESSAGE,
+                   on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+                   sent: Optional[asyncio.Event] = None) -> Any:
+        """One upstream call. `sent` is set once the call holds a limiter slot and goes out."""
+        await self.limiter.acquire(stage)
+        if sent is not None:
+            sent.set()
+        self.stats["in_flight"] += 1
+        outcome = "error"
+        try:
+            started = time.perf_counter()
+            self.stats["calls"] += 1
+            self.stats["prompt_chars"] += len(system_message) + len(prompt)
+            if on_partial is not None and self.streaming:
+                resp = await self._stream(prompt, system_message, on_partial)
+            else:
+                chat = self._new_chat(system_message)
+                self.stats["setup_ms_total"] += (time.perf_counter() - started) * 1000
+                resp = await chat.send_message(UserMessage(text=prompt))
+            self.stats["call_ms_total"] += (time.perf_counter() - started) * 1000
+            self.hedging.record(stage, time.perf_counter() - started)
+            outcome = "ok"
+            return resp
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                outcome = "rate_limited"
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+            await self.limiter.release(outcome)
+
+    async def send_hedged(self, prompt: str, stage: str = "adhoc",
+                          on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> Any:
+        """send() with a duplicate request if the call outlives the stage's hedge threshold.
+
+        The hedge clock starts once the primary request has been sent, not while it waits for
+        a limiter slot, and no hedge is sent while other calls are queued on the limiter:
+        a backlog is the limiter pacing calls, not a slow request. The first successful
+        response wins and the other request is cancelled. Only the primary request streams
+        partial output.
+        """
+        delay = self.hedging.hedge_delay(stage)
+        if delay is None:
+            return await self.send(prompt, stage=stage, on_partial=on_partial)
+        self.hedging.stats["calls"] += 1
+        sent = asyncio.Event()
+        primary = asyncio.create_task(self.send(prompt, stage=stage, on_partial=on_partial, sent=sent))
+        tasks = {primary}
+        try:
+            waiter = asyncio.create_task(sent.wait())
+            await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.limiter.waiting > 0:
+                self.hedging.stats["denied_queued"] += 1
+            elif not done and self.hedging.try_acquire():
+                tasks.add(asyncio.create_task(self.send(prompt, stage=stage)))
+            first_error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedging.stats["won"] += 1
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = self.stats["calls"] or 1
+        return {
+            "model": f"{self.provider}/{self.model}",
+            **self.stats,
+            "avg_setup_ms": round(self.stats["setup_ms_total"] / calls, 3),
+            "avg_call_ms": round(self.stats["call_ms_total"] / calls, 1),
+            "avg_prompt_chars": round(self.stats["prompt_chars"] / calls),
+        }
+
+# LLM circuit breaker
+LLM_FALLBACK_TEXT = "Real-time analysis temporarily unavailable. Please try again."
+
+llm_breaker = CircuitBreaker()
+
+llm_pool: Optional[LlmClientPool] = None
+
+def get_llm_pool() -> LlmClientPool:
+    global llm_pool
+    if llm_pool is None:
+        llm_pool = LlmClientPool(api_key=os.environ.get('OPENAI_API_KEY'))
+    return llm_pool
+
+# LLM response cache
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+class LlmResponseCache:
+    """Content-addressed cache of LLM responses.
+
+    Keys are a hash of (model, system message, rendered prompt). Lookups go to an
+    in-process LRU bounded by total response bytes first, then to the llm_cache
+    collection, whose TTL index expires old entries. With no collection the cache is
+    memory-only.
+    """
+
+    def __init__(self, collection, max_bytes: int = LLM_CACHE_MAX_BYTES, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def key(model: str, system_message: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, system_message, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    def _remember(self, key: str, text: str, created_at: datetime):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        self._entries[key] = (text, created_at, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        entry = self._entries.get(key)
+        if entry and entry[1] >= cutoff:
+            self._entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return entry[0]
+        doc = None
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": key, "created_at": {"$gte": cutoff}})
+            except Exception as e:
+                logging.warning(f"LLM cache read failed: {str(e)}")
+        if doc:
+            self._remember(key, doc["response"], doc["created_at"])
+            self.stats["mongo_hits"] += 1
+            return doc["response"]
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, text: str, model: str):
+        now = datetime.utcnow()
+        self._remember(key, text, now)
+        self.stats["stores"] += 1
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"response": text, "model": model, "created_at": now}},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.warning(f"LLM cache write failed: {str(e)}")
+
+    async def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+        if self.collection is None:
+            return
+        try:
+            await self.collection.delete_one({"_id": key})
+        except Exception as e:
+            logging.warning(f"LLM cache delete failed: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["mongo_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["mongo_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+llm_cache = LlmResponseCache(db.llm_cache)
+
+# Prompt templates
+PROMPTS_DIR = ROOT_DIR / "prompts"
+
+prompt_registry = PromptRegistry(PROMPTS_DIR)
+
+# Stages stored in market_intelligence that can be regenerated on their own
+REFRESHABLE_STAGES = ["buyer_migration", "seo_social_trends", "content_strategy", "content_assets"]
+
+# LLM call accounting
+LLM_CALL_LOG_FLUSH_SECONDS = float(os.environ.get("LLM_CALL_LOG_FLUSH_SECONDS", "5"))
+LLM_CALL_LOG_MAX_BUFFER = int(os.environ.get("LLM_CALL_LOG_MAX_BUFFER", "200"))
+
+def _usage_from(resp: Any) -> Dict[str, Optional[int]]:
+    usage = getattr(resp, "usage", None)
+    if usage is None and isinstance(resp, dict):
+        usage = resp.get("usage")
+    if usage is None:
+        return {"prompt_tokens": None, "completion_tokens": None}
+    get = usage.get if isinstance(usage, dict) else lambda k: getattr(usage, k, None)
+    return {"prompt_tokens": get("prompt_tokens"), "completion_tokens": get("completion_tokens")}
+
+class LlmCallLog:
+    """Write-behind buffer of per-call records for the llm_calls collection.
+
+    record() only appends in memory; records are flushed with insert_many every
+    LLM_CALL_LOG_FLUSH_SECONDS, as soon as LLM_CALL_LOG_MAX_BUFFER are pending, and on shutdown.
+    """
+
+    def __init__(self, collection, flush_seconds: float = LLM_CALL_LOG_FLUSH_SECONDS,
+                 max_buffer: int = LLM_CALL_LOG_MAX_BUFFER):
+        self.collection = collection
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0}
+
+    def record(self, **fields):
+        fields.setdefault("created_at", datetime.utcnow())
+        self._buffer.append(fields)
+        self.stats["recorded"] += 1
+        if len(self._buffer) >= self.max_buffer and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            self.stats["written"] += len(batch)
+        except Exception as e:
+            self.stats["dropped"] += len(batch)
+            logging.warning(f"Dropped {len(batch)} llm_calls records: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def start(self):
+        await self.collection.create_index([("created_at", -1), ("stage", 1)])
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+llm_call_log = LlmCallLog(db.llm_calls)
+
+# Offline ZIP gazetteer (build with zip_gazetteer.py); Nominatim is only consulted for ZIPs it lacks
+ZIP_GAZETTEER_PATH = os.environ.get("ZIP_GAZETTEER_PATH", str(ROOT_DIR / "data" / "zip_gazetteer.bin"))
+NOMINATIM_FALLBACK_ENABLED = os.environ.get("NOMINATIM_FALLBACK_ENABLED", "true").lower() == "true"
+zip_gazetteer = ZipGazetteer.load(ZIP_GAZETTEER_PATH)
+
+def _gazetteer_lookup(zip_code: str) -> Optional[Dict[str, Any]]:
+    return zip_gazetteer.lookup(zip_code) if zip_gazetteer is not None else None
+
+# Spatial index over gazetteer centroids, for nearby-territory suggestions
+NEARBY_DEFAULT_K = int(os.environ.get("NEARBY_DEFAULT_K", "10"))
+NEARBY_MAX_K = int(os.environ.get("NEARBY_MAX_K", "50"))
+NEARBY_MAX_RADIUS_MILES = float(os.environ.get("NEARBY_MAX_RADIUS_MILES", "100"))
+NEARBY_MAX_RESULTS = int(os.environ.get("NEARBY_MAX_RESULTS", "500"))
+NEARBY_SUGGESTIONS = int(os.environ.get("NEARBY_SUGGESTIONS", "5"))
+zip_index = ZipSpatialIndex.from_gazetteer(zip_gazetteer) if zip_gazetteer is not None else None
+
+async def _nearby_available(zip_code: str, latitude: float, longitude: float,
+                            k: Optional[int] = None, radius_miles: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Unowned ZIPs nearest a point: the k closest, or all within radius_miles (capped at
+    NEARBY_MAX_RESULTS). Ownership is read fresh from users on every call."""
+    owned = await users_collection.distinct("owned_territories")
+    exclude = zip_index.mask_for([*owned, zip_code.split('-')[0]])
+    if radius_miles is not None:
+        hits = zip_index.within(latitude, longitude, radius_miles, exclude)[:NEARBY_MAX_RESULTS]
+    else:
+        hits = zip_index.nearest(latitude, longitude, k or NEARBY_DEFAULT_K, exclude)
+    nearby = []
+    for zip_int, miles in hits:
+        place = zip_gazetteer.lookup(f"{zip_int:05d}")
+        nearby.append({
+            "zip_code": place["zip_code"],
+            "city": place["city"],
+            "state": place["state"],
+            "distance_miles": round(miles, 1),
+        })
+    return nearby
+
+# Geocode cache
+GEO_CACHE_TTL_DAYS = int(os.environ.get("GEO_CACHE_TTL_DAYS", "90"))
+# ZIPs Nominatim had no result for are retried after this, in case the miss was transient
+GEO_CACHE_NEGATIVE_TTL_HOURS = int(os.environ.get("GEO_CACHE_NEGATIVE_TTL_HOURS", "24"))
+GEO_CACHE_MAX_ENTRIES = int(os.environ.get("GEO_CACHE_MAX_ENTRIES", "10000"))
+
+class GeoCache:
+    """Geocode results per ZIP: an in-process LRU in front of the geo_cache collection.
+
+    A found place lives for GEO_CACHE_TTL_DAYS. A lookup that returned nothing is stored
+    as place=None for GEO_CACHE_NEGATIVE_TTL_HOURS, so unknown ZIPs stop reaching
+    Nominatim. Every document carries its own expires_at, which a TTL index reaps.
+    Geocoder errors are never cached.
+    """
+
+    MISS = object()
+
+    def __init__(self, collection, max_entries: int = GEO_CACHE_MAX_ENTRIES,
+                 ttl_days: int = GEO_CACHE_TTL_DAYS, negative_ttl_hours: int = GEO_CACHE_NEGATIVE_TTL_HOURS):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = timedelta(days=ttl_days)
+        self.negative_ttl = timedelta(hours=negative_ttl_hours)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "mongo_hits": 0, "negative_hits": 0, "misses": 0, "stores": 0, "negative_stores": 0}
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _remember(self, zip_code: str, place: Optional[Dict[str, Any]], expires_at: datetime):
+        self._entries[zip_code] = (place, expires_at)
+        self._entries.move_to_end(zip_code)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, zip_code: str):
+        """The cached place (None for a cached miss), or GeoCache.MISS if nothing is cached."""
+        now = datetime.utcnow()
+        entry = self._entries.get(zip_code)
+        if entry and entry[1] > now:
+            self._entries.move_to_end(zip_code)
+            self.stats["memory_hits"] += 1
+            if entry[0] is None:
+                self.stats["negative_hits"] += 1
+            return entry[0]
+        doc = None
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": zip_code, "expires_at": {"$gt": now}})
+            except Exception as e:
+                logging.warning(f"Geo cache read failed: {str(e)}")
+        if doc:
+            self._remember(zip_code, doc.get("place"), doc["expires_at"])
+            self.stats["mongo_hits"] += 1
+            if doc.get("place") is None:
+                self.stats["negative_hits"] += 1
+            return doc.get("place")
+        self.stats["misses"] += 1
+        return self.MISS
+
+    async def set(self, zip_code: str, place: Optional[Dict[str, Any]]):
+        now = datetime.utcnow()
+        expires_at = now + (self.ttl if place is not None else self.negative_ttl)
+        self._remember(zip_code, place, expires_at)
+        self.stats["stores" if place is not None else "negative_stores"] += 1
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": zip_code},
+                {"$set": {"place": place, "created_at": now, "expires_at": expires_at}},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.warning(f"Geo cache write failed: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["mongo_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round((lookups - self.stats["misses"]) / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_days": self.ttl.days,
+            "negative_ttl_hours": int(self.negative_ttl.total_seconds() // 3600),
+        }
+
+geo_cache = GeoCache(db.geo_cache)
+
+# Shared geocoder
+NOMINATIM_USER_AGENT = os.environ.get("NOMINATIM_USER_AGENT", "zip-intel-generator")
+# Nominatim's usage policy allows at most one request per second per application
+NOMINATIM_MIN_INTERVAL_SECONDS = float(os.environ.get("NOMINATIM_MIN_INTERVAL_SECONDS", "1.0"))
+NOMINATIM_TIMEOUT_SECONDS = float(os.environ.get("NOMINATIM_TIMEOUT_SECONDS", "5"))
+NOMINATIM_MAX_WORKERS = int(os.environ.get("NOMINATIM_MAX_WORKERS", "2"))
+
+class AsyncGeocoder:
+    """One Nominatim client for the whole process, kept off the event loop.
+
+    geopy's geocode() is a blocking HTTP call, so it runs on a small dedicated thread
+    pool. Requests are spaced at least NOMINATIM_MIN_INTERVAL_SECONDS apart across all
+    callers, and concurrent lookups for the same ZIP share a single request. Results,
+    including empty ones, go through the GeoCache before and after the request.
+    """
+
+    def __init__(self, cache: Optional[GeoCache] = None, user_agent: str = NOMINATIM_USER_AGENT,
+                 min_interval: float = NOMINATIM_MIN_INTERVAL_SECONDS, max_workers: int = NOMINATIM_MAX_WORKERS):
+        self.cache = cache
+        self._client = Nominatim(user_agent=user_agent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="geocoder")
+        self.min_interval = min_interval
+        self._throttle = asyncio.Lock()
+        self._next_slot = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._latencies: deque = deque(maxlen=200)
+        self.stats = {"lookups": 0, "requests": 0, "coalesced": 0, "empty": 0, "errors": 0, "throttle_wait_ms": 0.0}
+
+    async def _wait_turn(self):
+        async with self._throttle:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            if wait > 0:
+                self.stats["throttle_wait_ms"] += wait * 1000
+                await asyncio.sleep(wait)
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+
+    async def _request(self, query: str, timeout: float):
+        await self._wait_turn()
+        self.stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, lambda: self._client.geocode(query, timeout=timeout, addressdetails=True)
+            )
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._latencies.append((time.perf_counter() - started) * 1000)
+
+    async def _resolve(self, base_zip: str, timeout: float) -> Optional[Dict[str, Any]]:
+        if self.cache is not None:
+            cached = await self.cache.get(base_zip)
+            if cached is not GeoCache.MISS:
+                return cached
+        location = await self._request(f"{base_zip}, USA", timeout)
+        place = None
+        if location is not None:
+            place = {
+                "address": location.address,
+                "latitude": location.latitude,
+                "longitude": location.longitude,
+                "components": location.raw.get("address", {}),
+            }
+        else:
+            self.stats["empty"] += 1
+        if self.cache is not None:
+            await self.cache.set(base_zip, place)
+        return place
+
+    async def geocode(self, zip_code: str, timeout: float = NOMINATIM_TIMEOUT_SECONDS) -> Optional[Dict[str, Any]]:
+        """Place dict (address, latitude, longitude, components) for a US ZIP, or None.
+
+        Raises on upstream errors.
+        """
+        base_zip = zip_code.split('-')[0].strip()
+        self.stats["lookups"] += 1
+        future = self._inflight.get(base_zip)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(self._resolve(base_zip, timeout))
+        self._inflight[base_zip] = future
+        future.add_done_callback(lambda _: self._inflight.pop(base_zip, None))
+        return await asyncio.shield(future)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "min_interval_seconds": self.min_interval,
+            "inflight": len(self._inflight),
+            "p50_ms": _percentile(latencies, 50) if latencies else None,
+            "p95_ms": _percentile(latencies, 95) if latencies else None,
+            **{k: round(v, 1) if isinstance(v, float) else v for k, v in self.stats.items()},
+            "cache": self.cache.snapshot() if self.cache is not None else None,
+        }
+
+geocoder = AsyncGeocoder(geo_cache)
+
+# Location resolver
+US_STATE_ABBREVIATIONS = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+    "puerto rico": "PR",
+}
+US_STATE_CODES = frozenset(US_STATE_ABBREVIATIONS.values())
+LOCALITY_KEYS = ("city", "town", "village", "hamlet", "municipality", "suburb")
+COUNTY_SUFFIXES = ("County", "Parish", "Borough", "Census Area", "Municipality")
+# Suffix added to bare county names (the gazetteer's "Cobb") to match Nominatim's "Cobb County"
+COUNTY_SUFFIX_BY_STATE = {"LA": "Parish", "AK": "Borough"}
+
+def _state_abbreviation(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    if value.upper() in US_STATE_CODES:
+        return value.upper()
+    return US_STATE_ABBREVIATIONS.get(value.lower())
+
+def _location_from_geocode(zip_code: str, place: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Canonical record from a geocoder place, preferring Nominatim's structured components."""
+    components = place.get("components") or {}
+    parts = [part.strip() for part in place.get("address", "").split(",")]
+    iso_state = components.get("ISO3166-2-lvl4", "")
+    state = _state_abbreviation(components.get("state")) or _state_abbreviation(iso_state.rpartition("-")[2])
+    if state is None:
+        state = next((abbr for abbr in map(_state_abbreviation, parts) if abbr), None)
+    if state is None:
+        return None
+    city = next((components[key] for key in LOCALITY_KEYS if components.get(key)), None)
+    county = components.get("county")
+    if county is None:
+        county = next((part for part in parts if part.endswith(COUNTY_SUFFIXES)), None)
+    if city is None:
+        # Nominatim's display name for a postcode reads "ZIP, City, [County,] State, ..."
+        city = next((part for part in parts if part and not part.isdigit() and part != county and not _state_abbreviation(part)), None)
+    if not city:
+        return None
+    return {
+        "zip_code": zip_code,
+        "city": city,
+        "state": state,
+        "county": county,
+        "latitude": place["latitude"],
+        "longitude": place["longitude"],
+        "source": "nominatim",
+    }
+
+def _county_name(county: Optional[str], state: str) -> Optional[str]:
+    county = (county or "").strip()
+    if not county:
+        return None
+    if county.endswith(COUNTY_SUFFIXES):
+        return county
+    return f"{county} {COUNTY_SUFFIX_BY_STATE.get(state, 'County')}"
+
+def _canonical_location(location: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalise a record from any source: two-letter state, suffixed county, full_address."""
+    state = location.get("state") or ""
+    location["state"] = _state_abbreviation(state) or state.strip().upper()
+    location["county"] = _county_name(location.get("county"), location["state"])
+    county = f"{location['county']}, " if location["county"] else ""
+    location["full_address"] = f"{location['city']}, {county}{location['state']} {location['zip_code']}"
+    return location
+
+async def resolve_location(zip_code: str, timeout: float = NOMINATIM_TIMEOUT_SECONDS) -> Optional[Dict[str, Any]]:
+    """Canonical location record for a ZIP, or None if it cannot be resolved.
+
+    Sources in order: the offline gazetteer, Nominatim, then FALLBACK_ZIP_DATA. Nominatim
+    results go through geo_cache, so the availability check and later analysis jobs geocode
+    each ZIP at most once. Every record, whatever its source, has zip_code, city, state
+    (two-letter code), county (with its "County"/"Parish"/... suffix, or None), latitude,
+    longitude, full_address and source.
+    """
+    base_zip = zip_code.split('-')[0].strip()
+    place = _gazetteer_lookup(base_zip)
+    if place:
+        return _canonical_location({**place, "source": "gazetteer"})
+    if NOMINATIM_FALLBACK_ENABLED and timeout > 0:
+        try:
+            geocoded = await geocoder.geocode(base_zip, timeout=timeout)
+            location = _location_from_geocode(base_zip, geocoded) if geocoded else None
+            if location:
+                return _canonical_location(location)
+            logging.info(f"Nominatim could not place ZIP {base_zip}")
+        except Exception as e:
+            logging.error(f"Geocoding error for {base_zip}: {str(e)}")
+    fallback = FALLBACK_ZIP_DATA.get(base_zip)
+    if fallback:
+        return _canonical_location({**fallback, "zip_code": base_zip, "source": "fallback"})
+    return None
+
+def _parse_json_object(raw: str) -> Optional[Dict[str, Any]]:
+    """A non-empty JSON object from an LLM reply, tolerating prose around it; None if there is none."""
+    data = None
+    try:
+        data = json.loads(raw)
+    except Exception:
+        start = raw.find('{')
+        end = raw.rfind('}')
+        if start != -1 and end != -1:
+            try:
+                data = json.loads(raw[start:end+1])
+            except Exception:
+                data = None
+    return data if isinstance(data, dict) and data else None
 
 # Service
 class ZipIntelligenceService:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="zip-intel-generator")
-        self.llm = LlmChat(
-            api_key=os.environ.get('OPENAI_API_KEY'),
-            session_id=f"zipintel-{uuid.uuid4()}",
-            system_message=(
-                "You are an expert real estate market analyst. Provide comprehensive, data-driven "
-                "insights based on the user's requests. Always be specific, actionable, and professional."
-            ),
-        ).with_model("openai", "gpt-5")
+    def __init__(self, llm: Optional[LlmClientPool] = None):
+        self.llm = llm or get_llm_pool()
 
     async def _normalize_llm_response(self, resp: Any) -> str:
         try:
@@ -182,91 +942,118 @@ class ZipIntelligenceService:
         except Exception:
             return ""
 
-    async def _safe_send(self, prompt: str, max_retries: int = 3) -> str:
+    async def _safe_send(self, prompt: str, stage: str = "adhoc", zip_code: Optional[str] = None, max_retries: int = 3,
+                         use_cache: bool = True, on_content: Optional[Callable[..., Awaitable[None]]] = None,
+                         hedge: bool = True, accept: Optional[Callable[[str], bool]] = None) -> str:
+        """Send a prompt with caching, retries and the circuit breaker; LLM_FALLBACK_TEXT if all fail.
+
+        `on_content(text)` receives the text so far while the reply streams, and
+        `on_content(text, final=True)` once with the returned text (cached, generated or
+        fallback). `accept` is the stage's check on a response (e.g. that it parses): only
+        accepted responses are cached, and a cached response it rejects is evicted and regenerated.
+        """
+        started = time.perf_counter()
+        attempts = 0
+        usage: Dict[str, Optional[int]] = {"prompt_tokens": None, "completion_tokens": None}
+
+        def log_call(outcome: str, text: str):
+            llm_call_log.record(
+                stage=stage,
+                zip_code=zip_code,
+                outcome=outcome,
+                prompt_chars=len(prompt),
+                response_chars=len(text),
+                attempts=attempts,
+                retries=max(0, attempts - 1),
+                latency_ms=round((time.perf_counter() - started) * 1000, 1),
+                **usage,
+            )
+
+        model = f"{self.llm.provider}/{self.llm.model}"
+        cache_key = llm_cache.key(model, LLM_SYSTEM_MESSAGE, prompt)
+        if use_cache:
+            cached = await llm_cache.get(cache_key)
+            if cached is not None and accept is not None and not accept(cached):
+                await llm_cache.delete(cache_key)
+                cached = None
+            if cached is not None:
+                if on_content:
+                    await on_content(cached, final=True)
+                log_call("cached", cached)
+                return cached
+        else:
+            llm_cache.stats["bypassed"] += 1
         delay = 1.0
         last_err = None
-        for _ in range(max_retries):
+        for attempt in range(max_retries):
+            if not llm_breaker.allow_request():
+                last_err = last_err or RuntimeError("LLM circuit open")
+                break
+            attempts += 1
             try:
-                user_message = UserMessage(text=prompt)
-                resp = await self.llm.send_message(user_message)
+                if hedge:
+                    call = self.llm.send_hedged(prompt, stage=stage, on_partial=on_content)
+                else:
+                    call = self.llm.send(prompt, stage=stage, on_partial=on_content)
+                resp = await asyncio.wait_for(call, timeout=LLM_CALL_TIMEOUT_SECONDS)
+                usage = _usage_from(resp)
                 text = await self._normalize_llm_response(resp)
-                if text and not any(term in text.lower() for term in ["rate limit", "quota", "temporarily unavailable"]):
+                # Failures are classified from exceptions; report text that mentions "rate limits" is a success
+                if text and text != LLM_FALLBACK_TEXT:
+                    llm_breaker.record_success()
+                    if on_content:
+                        await on_content(text, final=True)
+                    if accept is None or accept(text):
+                        await llm_cache.set(cache_key, text, model)
+                    log_call("ok", text)
                     return text
-                raise RuntimeError("Upstream rate limit or temporary failure text")
+                raise RuntimeError("Empty or fallback LLM response")
+            except asyncio.CancelledError:
+                llm_breaker.abandon()
+                raise
             except Exception as e:
                 last_err = e
-                await asyncio.sleep(delay)
+                llm_breaker.record_failure()
+                remaining = remaining_budget()
+                if attempt == max_retries - 1 or llm_breaker.state == "open" or (remaining is not None and remaining <= delay):
+                    break
+                # Jittered so retries from concurrent jobs do not re-hit the provider in lockstep
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
                 delay = min(delay * 2, 8)
         logging.error(f"LLM send failed after retries: {str(last_err)}")
-        return "Real-time analysis temporarily unavailable. Please try again."
+        log_call("fallback" if attempts else "short_circuited", LLM_FALLBACK_TEXT)
+        if on_content:
+            await on_content(LLM_FALLBACK_TEXT, final=True)
+        return LLM_FALLBACK_TEXT
+
+    async def generate_stage(self, stage: str, zip_code: str, location_info: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        generators = {
+            "buyer_migration": self.generate_buyer_migration_intel,
+            "seo_social_trends": self.generate_seo_social_trends,
+            "content_strategy": self.generate_content_strategy,
+            "content_assets": self.generate_content_assets,
+        }
+        return await generators[stage](zip_code, location_info, **kwargs)
 
     async def get_location_info(self, zip_code: str) -> Dict[str, Any]:
-        try:
-            base_zip = zip_code.split('-')[0]
-            location = self.geolocator.geocode(f"{base_zip}, USA")
-            if location:
-                display = location.raw.get('display_name', '')
-                city = display.split(',')[0]
-                state = display.split(',')[-3].strip() if ',' in display else 'Unknown'
-                return {
-                    "city": city,
-                    "state": state,
-                    "latitude": location.latitude,
-                    "longitude": location.longitude,
-                    "full_address": location.address,
-                }
-            return {"city": "Unknown", "state": "Unknown", "latitude": 0, "longitude": 0}
-        except Exception as e:
-            logging.error(f"Geolocation error for {zip_code}: {str(e)}")
-            return {"city": "Unknown", "state": "Unknown", "latitude": 0, "longitude": 0}
+        remaining = remaining_budget()
+        timeout = NOMINATIM_TIMEOUT_SECONDS if remaining is None else min(NOMINATIM_TIMEOUT_SECONDS, remaining)
+        location = await resolve_location(zip_code, timeout=timeout)
+        return location or {"city": "Unknown", "state": "Unknown", "latitude": 0, "longitude": 0}
 
-    async def generate_buyer_migration_intel(self, zip_code: str, location_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_buyer_migration_intel(self, zip_code: str, location_info: Dict[str, Any], use_cache: bool = True,
+                                             on_content: Optional[Callable[..., Awaitable[None]]] = None) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
-            prompt = f"""
-Act as a real estate market analyst. I'm a Realtor in {city_name}, {state_name} (ZIP {zip_code}).
-
-Return your answer in clean, scannable Markdown with clear headings, subheadings, and lists. Use this exact structure:
-
-# Buyer Migration Intelligence – {city_name}, {state_name}
-
-## Market Overview
-- 2-4 sentences summarizing notable migration dynamics and housing context.
-
-## Where Buyers Are Coming From
-- Bullet list of top feeder cities/metros/states with brief reasons (1 line each)
-- If relevant, include a simple table:
-
-| Origin | Share/Trend | Note |
-| --- | --- | --- |
-| City A | Rising | Lower cost, job inflows |
-| City B | Stable | Lifestyle upgrade |
-
-## Why They're Moving
-- Bullet list of top motivations (cost of living, schools, taxes, commute, lifestyle, climate, etc.) with practical implications for messaging
-
-## Content Strategy To Attract These Buyers
-### Hooks (5-7)
-- Short, thumb-stopping hooks tailored to {city_name}
-
-### SEO Keywords (10-15)
-- Comma-separated list or bullets of local, high-intent terms
-
-### Video Title Ideas (5-10)
-- YouTube-style titles optimized for search and CTR
-
-## Quick Actions (3-5)
-- Actionable next steps you recommend a local agent takes this week
-
-Be specific, professional, and avoid fluff. Use lists where possible. Keep table simple and valid Markdown.
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("buyer_migration", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            response_text = await self._safe_send(prompt, stage="buyer_migration", zip_code=zip_code, use_cache=use_cache, on_content=on_content)
             return {
                 "summary": f"Migration analysis for {city_name}, {state_name} completed with real market data",
                 "location": {"city": city_name, "state": state_name, "zip_code": zip_code},
                 "analysis_content": response_text,
                 "generated_with": "ChatGPT GPT-5",
+                "prompt_version": prompt_registry.version("buyer_migration"),
                 "timestamp": datetime.utcnow().isoformat(),
             }
         except Exception as e:
@@ -278,107 +1065,19 @@ Be specific, professional, and avoid fluff. Use lists where possible. Keep table
                 "error": str(e),
             }
 
-    async def generate_seo_social_trends(self, zip_code: str, location_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_seo_social_trends(self, zip_code: str, location_info: Dict[str, Any], use_cache: bool = True,
+                                         on_content: Optional[Callable[..., Awaitable[None]]] = None) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
-            prompt = f"""
-Act as an SEO expert and social media strategist. I'm a Realtor in {city_name}, {state_name} (ZIP {zip_code}).
-
-Identify the top trending searches, keywords, and questions buyers are Googling and searching natively on Facebook, Instagram, X/Twitter, and TikTok about moving to or living in {city_name}, {state_name} in the past 90 days.
-
-Return your answer in clean Markdown with clear sections and lists using this structure:
-
-# SEO & Social Media Trends – {city_name}, {state_name}
-
-## Market Search Insights
-- 2-4 sentences summarizing how locals and relocators search across platforms for {city_name} topics
-
-## High-Volume Local Keywords (10-15)
-- Bullet list with user intent notes
-
-| Keyword | Intent | Search Volume Indicator |
-| --- | --- | --- |
-| moving to {city_name} | informational | High relocation interest |
-| best neighborhoods in {city_name} | research | School/lifestyle fit |
-| {city_name} cost of living | comparison | Budget planning |
-
-## Long-Tail Questions (8-12)
-- "What neighborhoods in {city_name} have the best schools?"
-- "How much does it cost to live in {city_name} compared to [other cities]?"
-- "What's the job market like in {city_name}?"
-
-## Video/Content Title Ideas (10)
-- YouTube and social-ready titles optimized for search and engagement
-- Include geo modifiers and trending angles
-
-## Platform-Specific Breakouts
-
-### Facebook
-**Native Queries/Hashtags (5-10):**
-- Bullet list of Facebook-specific searches and group discussions
-
-**Hook Patterns (3):**
-- Attention-grabbing opening lines that work on Facebook
-
-**Content Angles (3):**
-- Facebook-specific content approaches (community focus, local events, family-oriented)
-
-**Sample Post Titles (3):**
-- Ready-to-use Facebook post headlines
-
-### Instagram  
-**Native Queries/Hashtags (5-10):**
-- Instagram-specific hashtags and search behaviors
-
-**Hook Patterns (3):**
-- Visual-first hooks for feed posts and reels
-
-**Content Angles (3):**
-- Instagram-specific approaches (lifestyle, behind-scenes, aesthetic)
-
-**Sample Post Titles (3):**
-- Caption-ready titles for Instagram posts
-
-### X/Twitter
-**Native Queries/Hashtags (5-10):**
-- Twitter-specific hashtags and real-time search trends
-
-**Hook Patterns (3):**
-- Tweet-length hooks for engagement
-
-**Content Angles (3):**
-- Twitter-specific approaches (news, quick tips, conversations)
-
-**Sample Post Titles (3):**
-- Tweet-ready headlines
-
-### TikTok
-**Native Queries/Hashtags (5-10):**
-- TikTok trending hashtags and search behaviors
-
-**Hook Patterns (3):**
-- 8-second rule hooks for TikTok videos
-
-**Content Angles (3):**
-- TikTok-specific approaches (trends, education, entertainment)
-
-**Sample Post Titles (3):**
-- TikTok video titles and concepts
-
-## Implementation Tips
-- Cross-platform keyword usage strategies
-- Platform-specific optimization techniques
-- Content repurposing recommendations
-
-Use geo modifiers ({city_name}, nearby neighborhoods/landmarks). Keep Fair Housing compliant. Be specific and actionable.
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("seo_social_trends", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            response_text = await self._safe_send(prompt, stage="seo_social_trends", zip_code=zip_code, use_cache=use_cache, on_content=on_content)
             return {
                 "summary": f"SEO & YouTube analysis for {city_name}, {state_name} with real search data",
                 "location": {"city": city_name, "state": state_name, "zip_code": zip_code},
                 "analysis_content": response_text,
                 "generated_with": "ChatGPT GPT-5",
+                "prompt_version": prompt_registry.version("seo_social_trends"),
                 "timestamp": datetime.utcnow().isoformat(),
             }
         except Exception as e:
@@ -390,109 +1089,19 @@ Use geo modifiers ({city_name}, nearby neighborhoods/landmarks). Keep Fair Housi
                 "error": str(e),
             }
 
-    async def generate_content_strategy(self, zip_code: str, location_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_content_strategy(self, zip_code: str, location_info: Dict[str, Any], use_cache: bool = True,
+                                        on_content: Optional[Callable[..., Awaitable[None]]] = None) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
-            prompt = f"""
-Act as a real estate marketing strategist. Using buyer migration insights, trending searches, and keyword research, create a 6-month content strategy to attract relocation buyers to {city_name}, {state_name} (ZIP {zip_code}).
-
-Return clean Markdown with H2 sections in this EXACT order:
-
-Global Framework:
-- Theme cycles (4-week rotations): Cost of Living → Neighborhoods → Schools → Lifestyle → Commute → Buying Process
-- All content must be Fair Housing compliant and include {city_name} geo-modifiers
-
-# Multi-Platform Content Strategy – {city_name}, {state_name}
-
-## blog
-- Objective: [1 line goal]
-- Cadence: 2-3 posts per week over 24 weeks
-- Content types: [3-4 formats - guides, comparisons, market updates, neighborhoods]
-- Topic buckets: [4-5 themes with local angle]
-- Hook patterns: [3 headline approaches]
-- Primary SEO keywords: [5-7 terms]
-- KPIs: [3 metrics - traffic, leads, time on page]
-
-## email campaigns  
-- Objective: [1 line goal]
-- Cadence: 1 per week newsletter + 1 per month nurture sequence
-- Campaign types: [3-4 email formats - newsletters, nurture, market updates, buyer guides]
-- Topic buckets: [4-5 themes]
-- Subject line patterns: [3 approaches]
-- KPIs: [3 metrics - open rate, click rate, conversions]
-
-## Facebook
-- Objective: [1 line goal]
-- Cadence: 2-3 posts per week over 24 weeks
-- Content types: [3-4 formats - community posts, market updates, photo albums, reels]
-- Topic buckets: [4-5 themes with local community angle]
-- Hook patterns: [3 engagement approaches]
-- Primary hashtags: [5-7 local/geo tags]
-- KPIs: [3 metrics - engagement, reach, leads]
-
-## YouTube
-- Objective: [1 line goal]
-- Cadence: 1 video per week over 24 weeks
-- Content types: [3-4 formats - neighborhood tours, market analysis, buyer education, Q&A]
-- Topic buckets: [4-5 themes with visual storytelling]
-- Hook patterns: [3 video opening approaches]
-- Primary SEO keywords: [5-7 YouTube search terms]
-- KPIs: [3 metrics - views, watch time, subscribers]
-
-## YouTube Shorts
-- Objective: [1 line goal]
-- Cadence: 2-3 shorts per week over 24 weeks
-- Content types: [3-4 formats - quick tips, market snapshots, behind-scenes, trending responses]
-- Topic buckets: [4-5 themes optimized for short-form]
-- Hook patterns: [3 first-2-second approaches]
-- Primary hashtags: [5-7 trending/local tags]
-- KPIs: [3 metrics - views, shares, comments]
-
-## Instagram
-- Objective: [1 line goal]
-- Cadence: 3 posts + 2 reels per week over 24 weeks
-- Content types: [3-4 formats - carousel posts, single images, reels, stories highlights]
-- Topic buckets: [4-5 visual themes with local lifestyle]
-- Hook patterns: [3 visual/caption approaches]
-- Primary hashtags: [7-10 mix of local + national tags]
-- KPIs: [3 metrics - engagement rate, reach, profile visits]
-
-## TikTok
-- Objective: [1 line goal]
-- Cadence: 2-3 videos per week over 24 weeks
-- Content types: [3-4 formats - talking head, voiceover + b-roll, trend participation, educational]
-- Topic buckets: [4-5 themes optimized for TikTok audience]
-- Hook patterns: [3 first-8-second approaches]
-- Primary hashtags: [5-7 trending + niche tags]
-- KPIs: [3 metrics - views, shares, follows]
-
-## X/Twitter
-- Objective: [1 line goal]
-- Cadence: 3-4 posts per week over 24 weeks
-- Content types: [3-4 formats - single tweets, threads, market updates, community engagement]
-- Topic buckets: [4-5 themes for real-time discussion]
-- Hook patterns: [3 attention-grabbing approaches]
-- Primary hashtags: [3-5 industry + local tags]
-- KPIs: [3 metrics - impressions, engagement, retweets]
-
-## Snapchat
-- Objective: [1 line goal]
-- Cadence: 1-2 clips per week over 24 weeks
-- Content types: [3-4 formats - Spotlight clips, behind-scenes, quick tips, property highlights]
-- Topic buckets: [4-5 themes for younger demographic]
-- Hook patterns: [3 first-2-second approaches]
-- Primary keywords: [3-5 discovery terms]
-- KPIs: [3 metrics - views, time watched, shares]
-
-Keep each bullet point to 1 line. Focus on actionable strategy over detailed tactics.
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("content_strategy", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            response_text = await self._safe_send(prompt, stage="content_strategy", zip_code=zip_code, use_cache=use_cache, on_content=on_content)
             return {
                 "summary": f"8-week content strategy for {city_name}, {state_name} market",
                 "location": {"city": city_name, "state": state_name, "zip_code": zip_code},
                 "analysis_content": response_text,
                 "generated_with": "ChatGPT GPT-5",
+                "prompt_version": prompt_registry.version("content_strategy"),
                 "timestamp": datetime.utcnow().isoformat(),
             }
         except Exception as e:
@@ -504,42 +1113,14 @@ Keep each bullet point to 1 line. Focus on actionable strategy over detailed tac
                 "error": str(e),
             }
 
-    async def generate_content_assets(self, zip_code: str, location_info: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_content_assets(self, zip_code: str, location_info: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
-            prompt = f"""
-Act as a content production system for a Realtor in {city_name}, {state_name} (ZIP {zip_code}).
-
-Return ONLY valid JSON (no prose) with this schema:
-{{
-  "summary": "string",
-  "blog_posts": [
-    {{"name": "string", "title": "string", "content": "string"}}
-  ],
-  "email_campaigns": [
-    {{"name": "string", "title": "string", "content": "string"}}
-  ]
-}}
-
-Requirements:
-- name must use kebab-case and end with .txt (e.g., moving-to-{city_name}-guide.txt)
-- content must be plain text (no HTML/Markdown), ready to download as .txt
-- 8 emails, 10 blogs; keep each ~300-700 words
-- Titles should reflect local SEO terms and clear value
-"""
-            raw = await self._safe_send(prompt)
-            data = None
-            try:
-                data = json.loads(raw)
-            except Exception:
-                start = raw.find('{')
-                end = raw.rfind('}')
-                if start != -1 and end != -1:
-                    try:
-                        data = json.loads(raw[start:end+1])
-                    except Exception:
-                        data = None
+            prompt = prompt_registry.render("content_assets", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            raw = await self._safe_send(prompt, stage="content_assets", zip_code=zip_code, use_cache=use_cache,
+                                        accept=lambda text: _parse_json_object(text) is not None)
+            data = _parse_json_object(raw)
             if not data:
                 raise RuntimeError("Failed to parse content assets JSON")
 
@@ -589,6 +1170,7 @@ Requirements:
                 "blog_posts": blogs,
                 "email_campaigns": emails,
                 "generated_with": "ChatGPT GPT-5",
+                "prompt_version": prompt_registry.version("content_assets"),
                 "timestamp": datetime.utcnow().isoformat(),
             }
         except Exception as e:
@@ -602,7 +1184,7 @@ Requirements:
             }
 
     # Individual Platform Generation Methods
-    async def generate_instagram_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_instagram_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
@@ -611,41 +1193,8 @@ Requirements:
             instagram_strategy = content_strategy.get('analysis_content', '')
             seo_data = seo_social_trends.get('analysis_content', '')
             
-            prompt = f"""
-You are an Instagram content specialist for real estate agents in {city_name}, {state_name} (ZIP {zip_code}).
-
-Using this market intelligence:
-BUYER INSIGHTS: {buyer_insights}...
-INSTAGRAM STRATEGY: Look for Instagram-specific guidance in the content strategy.
-SEO DATA: Extract Instagram hashtags and content angles from the social media trends data.
-
-Generate 4 Instagram posts optimized for real estate agents targeting relocation buyers.
-
-Return ONLY valid JSON:
-{{
-  "summary": "Instagram content for {city_name}, {state_name}",
-  "instagram_posts": [
-    {{
-      "name": "ig-post-1-{zip_code}.txt",
-      "title": "Moving to {city_name}: What You Need to Know",
-      "content": "Complete Instagram post caption text here...",
-      "post_type": "feed",
-      "hashtags": "#MovingTo{city_name.replace(' ', '')} #RealEstate #Relocation",
-      "hook": "🏠 Thinking about moving to {city_name}?",
-      "visual_concept": "Neighborhood aerial shot with key stats overlay"
-    }}
-  ]
-}}
-
-Requirements:
-- 2 feed posts (carousel-style, 150-200 words each)
-- 2 reel scripts (hook + 60-90 second script)
-- Include 15-20 relevant hashtags per post
-- Reference buyer migration insights naturally
-- Use local SEO keywords from the research
-- Fair Housing compliant language
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("platform_instagram", city_name=city_name, state_name=state_name, zip_code=zip_code, buyer_insights=buyer_insights, city_tag=city_name.replace(' ', ''))
+            response_text = await self._safe_send(prompt, stage="platform_instagram", zip_code=zip_code, use_cache=use_cache)
             
             # Parse JSON response
             try:
@@ -676,41 +1225,15 @@ Requirements:
                 "error": str(e)
             }
 
-    async def generate_facebook_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_facebook_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
             buyer_insights = buyer_migration.get('analysis_content', '')[:500]
             facebook_strategy = content_strategy.get('analysis_content', '')
             
-            prompt = f"""
-You are a Facebook content specialist for real estate agents in {city_name}, {state_name} (ZIP {zip_code}).
-
-Using market intelligence data, generate 4 Facebook posts for community engagement and lead generation.
-
-Return ONLY valid JSON:
-{{
-  "summary": "Facebook content for {city_name}, {state_name}",
-  "facebook_posts": [
-    {{
-      "name": "fb-post-1-{zip_code}.txt",
-      "title": "{city_name} Market Update",
-      "content": "Facebook post content here...",
-      "post_type": "page_post",
-      "engagement_angle": "Community discussion starter",
-      "visual_concept": "Local market statistics graphic"
-    }}
-  ]
-}}
-
-Requirements:
-- 2 page posts (community-focused, 100-150 words)
-- 2 reel concepts (trend-based, 80-120 words)
-- Focus on community engagement and local insights
-- Include calls-to-action for consultation bookings
-- Reference buyer migration patterns for {city_name}
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("platform_facebook", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            response_text = await self._safe_send(prompt, stage="platform_facebook", zip_code=zip_code, use_cache=use_cache)
             
             try:
                 import json
@@ -736,38 +1259,12 @@ Requirements:
                 "error": str(e)
             }
 
-    async def generate_tiktok_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_tiktok_content(self, zip_code: str, location_info: Dict[str, Any], buyer_migration: Dict[str, Any], seo_social_trends: Dict[str, Any], content_strategy: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         city_name = location_info.get('city', 'Unknown')
         state_name = location_info.get('state', 'Unknown')
         try:
-            prompt = f"""
-You are a TikTok content specialist for real estate agents in {city_name}, {state_name} (ZIP {zip_code}).
-
-Generate 4 TikTok video scripts optimized for the real estate vertical.
-
-Return ONLY valid JSON:
-{{
-  "summary": "TikTok content for {city_name}, {state_name}",
-  "tiktok_posts": [
-    {{
-      "name": "tt-video-1-{zip_code}.txt",
-      "title": "Moving to {city_name}? Here's what you need to know",
-      "content": "TikTok script with timing cues...",
-      "hook": "POV: You're thinking about moving to {city_name}",
-      "video_concept": "Quick facts with text overlay",
-      "duration": "30s"
-    }}
-  ]
-}}
-
-Requirements:
-- 4 video scripts (15-30 seconds each)
-- Include 8-second hook rule compliance
-- Trend-aware content angles
-- Local market insights
-- Engaging visual concepts
-"""
-            response_text = await self._safe_send(prompt)
+            prompt = prompt_registry.render("platform_tiktok", city_name=city_name, state_name=state_name, zip_code=zip_code)
+            response_text = await self._safe_send(prompt, stage="platform_tiktok", zip_code=zip_code, use_cache=use_cache)
             
             try:
                 import json
@@ -855,89 +1352,1156 @@ Requirements:
         }
 
 # Status helpers
-async def _init_status(zip_code: str) -> Dict[str, Any]:
+ACTIVE_JOB_STATES = ["queued", "running", "cancelling"]
+
+async def _claim_status(zip_code: str) -> tuple:
+    """Atomically start a new job for this ZIP unless one is already queued or running.
+
+    Relies on the unique zip_code index, which startup guarantees (see
+    _ensure_status_index): when an active status exists the filtered upsert tries to insert
+    a second document and fails, and the caller gets the existing status.
+    Returns (status_doc, created).
+    """
     now = datetime.utcnow()
     job_id = str(uuid.uuid4())
     tasks = {tid: {"status": "pending", "percent": 0, "title": tid} for tid in TASK_ORDER}
     doc = {
         "zip_code": zip_code,
         "job_id": job_id,
-        "state": "running",
+        "state": "queued",
         "overall_percent": 0,
         "tasks": tasks,
+        "error": None,
+        "deadline_at": None,  # set when a worker starts the job and its budget begins
         "created_at": now,
         "updated_at": now,
     }
-    await db.analysis_status.update_one({"zip_code": zip_code}, {"$set": doc}, upsert=True)
-    return doc
-
-async def _update_task(zip_code: str, task_id: str, status: str, percent: int):
-    await db.analysis_status.update_one(
-        {"zip_code": zip_code},
-        {"$set": {f"tasks.{task_id}.status": status, f"tasks.{task_id}.percent": percent, "updated_at": datetime.utcnow()}},
-    )
-
-async def _update_overall(zip_code: str, percent: int):
-    await db.analysis_status.update_one(
-        {"zip_code": zip_code},
-        {"$set": {"overall_percent": percent, "updated_at": datetime.utcnow()}},
-    )
-
-async def _complete_status(zip_code: str, state: str = "done"):
-    await db.analysis_status.update_one(
-        {"zip_code": zip_code},
-        {"$set": {"state": state, "overall_percent": 100 if state == "done" else 0, "updated_at": datetime.utcnow()}},
-    )
-
-# Background job
-async def _run_zip_job(zip_code: str):
     try:
-        svc = ZipIntelligenceService()
-        await _update_task(zip_code, "location", "running", 50)
-        location_info = await svc.get_location_info(zip_code)
-        await _update_task(zip_code, "location", "done", 100)
-        await _update_overall(zip_code, TASK_PERCENT["location"])
-
-        await _update_task(zip_code, "buyer_migration", "running", 10)
-        buyer_migration = await svc.generate_buyer_migration_intel(zip_code, location_info)
-        await _update_task(zip_code, "buyer_migration", "done", 100)
-        await _update_overall(zip_code, TASK_PERCENT["buyer_migration"])
-        await asyncio.sleep(0.5)
+        claimed = await db.analysis_status.find_one_and_update(
+            {"zip_code": zip_code, "state": {"$nin": ACTIVE_JOB_STATES}},
+            {"$set": doc},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        return claimed, True
+    except DuplicateKeyError:
+        existing = await db.analysis_status.find_one({"zip_code": zip_code}, {"_id": 0})
+        return existing, False
+
+async def _ensure_status_index():
+    """Remove duplicate analysis_status documents per ZIP, then create the unique zip_code index.
+
+    Statuses written before the claim existed could hold several documents for one ZIP, and
+    the index cannot be built over them. The most recently updated document is kept. Raises
+    if the index cannot be created: without it the claim is not atomic and concurrent
+    starts would run duplicate pipelines, so the app must not start.
+    """
+    duplicates = db.analysis_status.aggregate([
+        {"$sort": {"updated_at": -1}},
+        {"$group": {"_id": "$zip_code", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    removed = 0
+    async for group in duplicates:
+        result = await db.analysis_status.delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += result.deleted_count
+        logging.warning(f"Removed {result.deleted_count} duplicate analysis_status documents for ZIP {group['_id']}")
+    if removed:
+        logging.warning(f"Removed {removed} duplicate analysis_status documents in total")
+    await db.analysis_status.create_index("zip_code", unique=True)
+
+# Status write buffer
+STATUS_FLUSH_SECONDS = float(os.environ.get("STATUS_FLUSH_SECONDS", "0.5"))
+
+class StatusWriteBuffer:
+    """Write-behind buffer for in-progress analysis_status updates.
+
+    set() merges $set fields per ZIP in memory, so repeated writes to the same field
+    collapse into the latest value. Every STATUS_FLUSH_SECONDS all pending ZIPs go out
+    in one unordered bulk_write. A job's terminal update is flushed straight away with
+    flush(zip_code, final=True), which also stores how many updates the job made
+    against how many documents were actually written, under status_writes.
+    """
+
+    def __init__(self, collection, flush_seconds: float = STATUS_FLUSH_SECONDS):
+        self.collection = collection
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._counts: Dict[str, List[int]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"updates": 0, "writes": 0, "bulk_writes": 0, "errors": 0}
+
+    def set(self, zip_code: str, fields: Dict[str, Any]):
+        fields.setdefault("updated_at", datetime.utcnow())
+        self._pending.setdefault(zip_code, {}).update(fields)
+        self._counts.setdefault(zip_code, [0, 0])[0] += 1
+        self.stats["updates"] += 1
+
+    async def flush(self, zip_code: Optional[str] = None, final: bool = False) -> Optional[Dict[str, int]]:
+        async with self._lock:
+            if zip_code is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {zip_code: self._pending.pop(zip_code)} if zip_code in self._pending else {}
+            counts = None
+            if final and zip_code is not None:
+                updates, writes = self._counts.pop(zip_code, [0, 0])
+                counts = {"updates": updates, "writes": writes + 1}
+                batch.setdefault(zip_code, {"updated_at": datetime.utcnow()})["status_writes"] = counts
+            if not batch:
+                return counts
+            try:
+                await self.collection.bulk_write(
+                    [UpdateOne({"zip_code": z}, {"$set": fields}) for z, fields in batch.items()],
+                    ordered=False,
+                )
+            except Exception as e:
+                self.stats["errors"] += 1
+                logging.warning(f"Status flush failed for {len(batch)} ZIP(s): {str(e)}")
+                for z, fields in batch.items():
+                    self._pending[z] = {**fields, **self._pending.get(z, {})}
+                return counts
+            self.stats["bulk_writes"] += 1
+            self.stats["writes"] += len(batch)
+            for z in batch:
+                if z in self._counts:
+                    self._counts[z][1] += 1
+            return counts
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        updates, writes = self.stats["updates"], self.stats["writes"]
+        return {
+            "flush_seconds": self.flush_seconds,
+            "pending_zips": len(self._pending),
+            "writes_saved": max(0, updates - writes),
+            "coalescing_ratio": round(updates / writes, 2) if writes else None,
+            **self.stats,
+        }
 
-        await _update_task(zip_code, "seo_social_trends", "running", 10)
-        seo = await svc.generate_seo_social_trends(zip_code, location_info)
-        await _update_task(zip_code, "seo_social_trends", "done", 100)
-        await _update_overall(zip_code, TASK_PERCENT["seo_social_trends"])
-        await asyncio.sleep(0.5)
+status_buffer = StatusWriteBuffer(db.analysis_status)
+
+def _update_task(zip_code: str, task_id: str, status: str, percent: int):
+    status_buffer.set(zip_code, {f"tasks.{task_id}.status": status, f"tasks.{task_id}.percent": percent})
+
+def _update_overall(zip_code: str, percent: int):
+    status_buffer.set(zip_code, {"overall_percent": percent})
+
+async def _mark_status_cancelled(zip_code: str):
+    """Mark the job and every unfinished task cancelled; finished tasks keep their results."""
+    await status_buffer.flush(zip_code)
+    status_doc = await db.analysis_status.find_one({"zip_code": zip_code}, {"tasks": 1})
+    update: Dict[str, Any] = {"state": "cancelled"}
+    for tid, task in (status_doc or {}).get("tasks", {}).items():
+        if task.get("status") != "done":
+            update[f"tasks.{tid}.status"] = "cancelled"
+    status_buffer.set(zip_code, update)
+    await status_buffer.flush(zip_code, final=True)
+
+async def _complete_status(zip_code: str, state: str = "done", error: Optional[str] = None):
+    fields: Dict[str, Any] = {"state": state, "overall_percent": 100 if state in ("done", "partial") else 0}
+    if error is not None:
+        fields["error"] = error
+    if state == "failed":
+        fields.pop("overall_percent")
+    status_buffer.set(zip_code, fields)
+    counts = await status_buffer.flush(zip_code, final=True)
+    if counts:
+        logging.info(f"Status writes for {zip_code}: {counts['updates']} updates in {counts['writes']} writes")
+
+# Stage progress
+PROGRESS_HISTORY_SAMPLES = int(os.environ.get("PROGRESS_HISTORY_SAMPLES", "50"))
+PROGRESS_MODEL_REFRESH_SECONDS = float(os.environ.get("PROGRESS_MODEL_REFRESH_SECONDS", "600"))
+PROGRESS_TICK_SECONDS = float(os.environ.get("PROGRESS_TICK_SECONDS", "5"))
+# Used until a stage has successful calls in llm_calls to learn from
+PROGRESS_DEFAULT_CHARS = int(os.environ.get("PROGRESS_DEFAULT_CHARS", "8000"))
+PROGRESS_DEFAULT_SECONDS = float(os.environ.get("PROGRESS_DEFAULT_SECONDS", "60"))
+# A running stage sits between these fractions until its result arrives
+PROGRESS_STAGE_START = 0.1
+PROGRESS_STAGE_CEILING = 0.95
+
+class StageLengthModel:
+    """Typical output length and latency per stage: the median over the stage's last
+    PROGRESS_HISTORY_SAMPLES successful calls in llm_calls, refreshed every
+    PROGRESS_MODEL_REFRESH_SECONDS."""
+
+    def __init__(self, collection, samples: int = PROGRESS_HISTORY_SAMPLES, refresh_seconds: float = PROGRESS_MODEL_REFRESH_SECONDS):
+        self.collection = collection
+        self.samples = samples
+        self.refresh_seconds = refresh_seconds
+        self._typical: Dict[str, tuple] = {}
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        typical = {}
+        for stage in REFRESHABLE_STAGES:
+            chars, seconds = [], []
+            cursor = self.collection.find(
+                {"stage": stage, "outcome": "ok"}, {"response_chars": 1, "latency_ms": 1},
+            ).sort("created_at", -1).limit(self.samples)
+            async for call in cursor:
+                chars.append(call["response_chars"])
+                seconds.append(call["latency_ms"] / 1000)
+            if chars:
+                typical[stage] = (_percentile(sorted(chars), 50), _percentile(sorted(seconds), 50))
+        self._typical = typical
+        self._refreshed_at = time.monotonic()
+
+    async def typical(self, stage: str) -> tuple:
+        """(chars, seconds) a successful call for this stage usually takes."""
+        if time.monotonic() - self._refreshed_at > self.refresh_seconds:
+            async with self._lock:
+                if time.monotonic() - self._refreshed_at > self.refresh_seconds:
+                    try:
+                        await self.refresh()
+                    except Exception as e:
+                        self._refreshed_at = time.monotonic()
+                        logging.warning(f"Could not refresh stage length model: {str(e)}")
+        return self._typical.get(stage, (PROGRESS_DEFAULT_CHARS, PROGRESS_DEFAULT_SECONDS))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {stage: {"chars": chars, "seconds": seconds} for stage, (chars, seconds) in self._typical.items()}
+
+stage_length_model = StageLengthModel(db.llm_calls)
+
+class JobProgress:
+    """Per-job stage fractions behind tasks.<id>.percent and the weighted overall_percent.
+
+    A running stage advances from PROGRESS_STAGE_START towards PROGRESS_STAGE_CEILING by the
+    share of its typical output length streamed so far. Stages that do not stream (cache
+    hits, content_assets, or no streaming client) advance by elapsed time against their
+    typical latency instead.
+    """
+
+    def __init__(self, zip_code: str):
+        self.zip_code = zip_code
+        self.fractions: Dict[str, float] = {}
+        self._typical: Dict[str, tuple] = {}
+        self._started: Dict[str, float] = {}
+        self._streaming: set = set()
+
+    def overall_percent(self) -> int:
+        return round(sum(TASK_WEIGHT.get(tid, 0) * fraction for tid, fraction in self.fractions.items()))
+
+    def _percent(self, task_id: str) -> int:
+        return round(100 * self.fractions.get(task_id, 0))
+
+    def _scaled(self, share: float) -> float:
+        return PROGRESS_STAGE_START + (PROGRESS_STAGE_CEILING - PROGRESS_STAGE_START) * min(1.0, share)
+
+    async def begin(self, task_id: str):
+        self._typical[task_id] = await stage_length_model.typical(task_id)
+        self._started[task_id] = time.monotonic()
+        self.fractions[task_id] = PROGRESS_STAGE_START
+
+    def finish(self, task_id: str):
+        self.fractions[task_id] = 1.0
+
+    def streamed(self, task_id: str, chars: int) -> Dict[str, Any]:
+        """Record streamed output and return the status fields to $set alongside it."""
+        self._streaming.add(task_id)
+        typical_chars = self._typical.get(task_id, (PROGRESS_DEFAULT_CHARS, 0))[0]
+        self.fractions[task_id] = max(self.fractions.get(task_id, 0), self._scaled(chars / max(typical_chars, 1)))
+        return {f"tasks.{task_id}.percent": self._percent(task_id), "overall_percent": self.overall_percent()}
+
+    async def track(self, task_id: str):
+        """Advance a non-streaming stage by elapsed time until cancelled."""
+        while True:
+            await asyncio.sleep(PROGRESS_TICK_SECONDS)
+            if task_id in self._streaming or task_id not in self._started:
+                continue
+            typical_seconds = self._typical[task_id][1] or PROGRESS_DEFAULT_SECONDS
+            fraction = self._scaled((time.monotonic() - self._started[task_id]) / typical_seconds)
+            if round(100 * fraction) == self._percent(task_id):
+                continue
+            self.fractions[task_id] = fraction
+            status_buffer.set(self.zip_code, {f"tasks.{task_id}.percent": self._percent(task_id), "overall_percent": self.overall_percent()})
+
+# Streamed stage output
+STREAM_FLUSH_INTERVAL_SECONDS = float(os.environ.get("STREAM_FLUSH_INTERVAL_SECONDS", "0.5"))
+STREAM_FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "2048"))
+
+class StageContentWriter:
+    """Throttled writer of a stage's Markdown into tasks.<task_id>.analysis_content while it streams.
+
+    Hands the text so far to the status buffer when STREAM_FLUSH_INTERVAL_SECONDS have
+    passed or STREAM_FLUSH_BYTES of new text have arrived since the last hand-off, and
+    always on the final text. With a JobProgress, partial writes also carry the stage
+    percent and overall_percent derived from the length streamed so far.
+    """
+
+    def __init__(self, zip_code: str, task_id: str, progress: Optional[JobProgress] = None):
+        self.zip_code = zip_code
+        self.task_id = task_id
+        self.progress = progress
+        self._last_flush = 0.0
+        self._flushed_len = 0
+
+    async def __call__(self, text: str, final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._last_flush < STREAM_FLUSH_INTERVAL_SECONDS and abs(len(text) - self._flushed_len) < STREAM_FLUSH_BYTES:
+            return
+        self._last_flush = now
+        self._flushed_len = len(text)
+        update = {f"tasks.{self.task_id}.analysis_content": text}
+        if self.progress is not None and not final:
+            update.update(self.progress.streamed(self.task_id, len(text)))
+        status_buffer.set(self.zip_code, update)
+
+# Stage scheduler
+async def _run_stage_graph(zip_code: str, stages: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]],
+                           completed: Optional[Dict[str, Any]] = None, progress: Optional[JobProgress] = None) -> Dict[str, Any]:
+    """Run stages as soon as their TASK_INPUTS are satisfied, concurrently where possible.
+
+    Each stage callable receives the results of the stages it depends on. Stages present in
+    `completed` are not run; their results are used as-is. Task status and the
+    weighted overall_percent are written to analysis_status as stages start and finish, and
+    in between as `progress` estimates them. A stage
+    still running at the job deadline is cancelled and marked timed_out, as are the stages
+    waiting on it, and StageTimeout is raised once nothing else can run.
+    """
+    progress = progress or JobProgress(zip_code)
+    results: Dict[str, Any] = dict(completed or {})
+    pending = {tid: fn for tid, fn in stages.items() if tid not in results}
+    running: Dict[asyncio.Task, str] = {}
+    timed_out: List[str] = []
+    for tid in results:
+        progress.finish(tid)
+        _update_task(zip_code, tid, "done", 100)
+    if results:
+        _update_overall(zip_code, progress.overall_percent())
+
+    async def run(task_id: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        await progress.begin(task_id)
+        _update_task(zip_code, task_id, "running", round(100 * PROGRESS_STAGE_START))
+        inputs = {dep: results[dep] for dep in TASK_INPUTS.get(task_id, [])}
+        ticker = asyncio.create_task(progress.track(task_id))
+        try:
+            return await _within_deadline(fn(inputs))
+        finally:
+            ticker.cancel()
 
-        await _update_task(zip_code, "content_strategy", "running", 10)
-        strategy = await svc.generate_content_strategy(zip_code, location_info)
-        await _update_task(zip_code, "content_strategy", "done", 100)
-        await _update_overall(zip_code, TASK_PERCENT["content_strategy"])
-        await asyncio.sleep(0.5)
+    try:
+        while pending or running:
+            ready = [tid for tid in pending if all(dep in results for dep in TASK_INPUTS.get(tid, []))]
+            for tid in ready:
+                running[asyncio.create_task(run(tid, pending.pop(tid)))] = tid
+            if not running:
+                if not timed_out:
+                    raise RuntimeError(f"Unsatisfiable stage inputs: {sorted(pending)}")
+                for tid in list(pending):
+                    pending.pop(tid)
+                    timed_out.append(tid)
+                    _update_task(zip_code, tid, "timed_out", 0)
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tid = running.pop(task)
+                try:
+                    results[tid] = task.result()
+                except asyncio.TimeoutError:
+                    timed_out.append(tid)
+                    _update_task(zip_code, tid, "timed_out", 0)
+                    continue
+                progress.finish(tid)
+                _update_task(zip_code, tid, "done", 100)
+                _update_overall(zip_code, progress.overall_percent())
+    finally:
+        for task in running:
+            task.cancel()
+    if timed_out:
+        raise StageTimeout(f"Analysis exceeded its {JOB_DEADLINE_SECONDS:.0f}s time budget (timed out: {', '.join(timed_out)})")
+    return results
+
+# Stage checkpoints
+CHECKPOINT_TTL_SECONDS = int(os.environ.get("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+
+def _is_valid_stage_result(stage: str, result: Any) -> bool:
+    """True if a stage result is real output worth keeping, not a fallback or stale-prompt result."""
+    if not isinstance(result, dict):
+        return False
+    if stage == "location":
+        return result.get("city", "Unknown") != "Unknown"
+    if "error" in result or result.get("analysis_content") == LLM_FALLBACK_TEXT:
+        return False
+    if result.get("prompt_version") != prompt_registry.version(stage):
+        return False
+    if stage == "content_assets":
+        return bool(result.get("blog_posts") or result.get("email_campaigns"))
+    return bool(result.get("analysis_content"))
+
+async def _load_checkpoints(zip_code: str) -> Dict[str, Any]:
+    doc = await db.analysis_checkpoints.find_one({"_id": zip_code})
+    stages = (doc or {}).get("stages", {})
+    return {stage: result for stage, result in stages.items() if _is_valid_stage_result(stage, result)}
+
+async def _save_checkpoint(zip_code: str, stage: str, result: Any):
+    now = datetime.utcnow()
+    await db.analysis_checkpoints.update_one(
+        {"_id": zip_code},
+        {"$set": {f"stages.{stage}": result, "updated_at": now}},
+        upsert=True,
+    )
 
-        await _update_task(zip_code, "content_assets", "running", 10)
-        assets = await svc.generate_content_assets(zip_code, location_info)
-        await _update_task(zip_code, "content_assets", "done", 100)
-        await _update_overall(zip_code, TASK_PERCENT["content_assets"])
+def _checkpointed(zip_code: str, stage: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Callable[[Dict[str, Any]], Awaitable[Any]]:
+    """Wrap a stage so its result is persisted as soon as it finishes, if it is valid."""
+    async def run(inputs: Dict[str, Any]) -> Any:
+        result = await fn(inputs)
+        if _is_valid_stage_result(stage, result):
+            await _save_checkpoint(zip_code, stage, result)
+        return result
+    return run
+
+# Section freshness: each stored section expires on its own schedule
+SECTION_TTL_DAYS = {
+    "buyer_migration": float(os.environ.get("TTL_BUYER_MIGRATION_DAYS", "21")),
+    "seo_social_trends": float(os.environ.get("TTL_SEO_SOCIAL_TRENDS_DAYS", "3")),
+    "content_strategy": float(os.environ.get("TTL_CONTENT_STRATEGY_DAYS", "7")),
+    "content_assets": float(os.environ.get("TTL_CONTENT_ASSETS_DAYS", "7")),
+}
 
+async def _latest_analysis(zip_code: str) -> Optional[Dict[str, Any]]:
+    return await db.market_intelligence.find_one({"zip_code": zip_code}, sort=[("created_at", -1)])
+
+def _section_freshness(analysis: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return section_freshness(analysis, SECTION_TTL_DAYS, _is_valid_stage_result)
+
+def _stale_sections(analysis: Optional[Dict[str, Any]], lead_seconds: float = 0) -> List[str]:
+    return stale_sections(analysis, SECTION_TTL_DAYS, _is_valid_stage_result, lead_seconds)
+
+async def _stale_sections_for(zip_code: str) -> List[str]:
+    return _stale_sections(await _latest_analysis(zip_code))
+
+async def _store_analysis(zip_code: str, analysis: Optional[Dict[str, Any]], stale: List[str], failed: List[str],
+                          results: Dict[str, Any], now: datetime):
+    """Write a job's results to market_intelligence and drop its checkpoints. On an existing
+    analysis only the stale sections that regenerated validly are replaced."""
+    if analysis:
+        refreshed = [section for section in stale if section not in failed]
+        if refreshed:
+            update = {section: results[section] for section in refreshed}
+            update.update({f"section_updated_at.{section}": now for section in refreshed})
+            update["updated_at"] = now
+            await db.market_intelligence.update_one({"_id": analysis["_id"]}, {"$set": update})
+            logging.info(f"Refreshed stale sections {refreshed} for {zip_code}")
+    else:
         intelligence = MarketIntelligence(
             zip_code=zip_code,
-            buyer_migration=buyer_migration,
-            seo_social_trends=seo,
-            content_strategy=strategy,
+            buyer_migration=results["buyer_migration"],
+            seo_social_trends=results["seo_social_trends"],
+            content_strategy=results["content_strategy"],
             hidden_listings={"summary": "Pending generation", "analysis_content": "Not generated yet."},
             market_hooks={"summary": "Pending generation", "detailed_analysis": "Not generated yet."},
-            content_assets=assets,
+            content_assets=results["content_assets"],
+            section_updated_at={section: now for section in SECTION_TTL_DAYS},
         )
         await db.market_intelligence.insert_one(intelligence.dict())
-        await _complete_status(zip_code, state="done")
+    await db.analysis_checkpoints.delete_one({"_id": zip_code})
+
+# Background job
+async def _run_zip_job(zip_code: str, sections: Optional[List[str]] = None):
+    """Generate or refresh the analysis for a ZIP. `sections` forces those sections to be
+    regenerated on top of any that are already stale (used by pre-warming).
+
+    A refresh bypasses the LLM response cache, whose entries can outlive a section's TTL, and
+    only replaces sections whose new result is valid; the rest keep their previous content and
+    timestamp, and the job ends "partial".
+    """
+    started_at = datetime.utcnow()
+    _job_deadline.set(time.monotonic() + JOB_DEADLINE_SECONDS)
+    try:
+        await db.analysis_status.update_one(
+            {"zip_code": zip_code},
+            {"$set": {
+                "state": "running",
+                "deadline_at": started_at + timedelta(seconds=JOB_DEADLINE_SECONDS),
+                "updated_at": started_at,
+            }},
+        )
+        svc = ZipIntelligenceService()
+        progress = JobProgress(zip_code)
+        analysis = await _latest_analysis(zip_code)
+        use_cache = analysis is None
+        stages = {
+            "location": lambda _: svc.get_location_info(zip_code),
+            "buyer_migration": lambda r: svc.generate_buyer_migration_intel(zip_code, r["location"], use_cache=use_cache, on_content=StageContentWriter(zip_code, "buyer_migration", progress)),
+            "seo_social_trends": lambda r: svc.generate_seo_social_trends(zip_code, r["location"], use_cache=use_cache, on_content=StageContentWriter(zip_code, "seo_social_trends", progress)),
+            "content_strategy": lambda r: svc.generate_content_strategy(zip_code, r["location"], use_cache=use_cache, on_content=StageContentWriter(zip_code, "content_strategy", progress)),
+            "content_assets": lambda r: svc.generate_content_assets(zip_code, r["location"], use_cache=use_cache),
+        }
+        stale = _stale_sections(analysis)
+        if analysis and sections:
+            stale = [section for section in SECTION_TTL_DAYS if section in stale or section in sections]
+        completed: Dict[str, Any] = {}
+        if analysis:
+            completed = {section: analysis[section] for section in SECTION_TTL_DAYS if section not in stale}
+            stored_location = analysis.get("buyer_migration", {}).get("location") or {}
+            if _is_valid_stage_result("location", stored_location):
+                completed["location"] = stored_location
+        checkpoints = await _load_checkpoints(zip_code)
+        if checkpoints:
+            logging.info(f"Resuming {zip_code} from checkpoints: {sorted(checkpoints)}")
+        completed.update(checkpoints)
+        results = await _run_stage_graph(
+            zip_code,
+            {stage: _checkpointed(zip_code, stage, fn) for stage, fn in stages.items()},
+            completed=completed,
+            progress=progress,
+        )
+
+        now = datetime.utcnow()
+        regenerated = stale if analysis else list(SECTION_TTL_DAYS)
+        failed = [section for section in regenerated if not _is_valid_stage_result(section, results[section])]
+        try:
+            await _within_deadline(_store_analysis(zip_code, analysis, stale, failed, results, now))
+        except asyncio.TimeoutError:
+            raise StageTimeout(f"Analysis exceeded its {JOB_DEADLINE_SECONDS:.0f}s time budget while saving results")
+        if failed:
+            logging.warning(f"Sections {failed} for {zip_code} could not be regenerated")
+            await _complete_status(zip_code, state="partial", error=f"Could not regenerate: {', '.join(failed)}")
+        else:
+            await _complete_status(zip_code, state="done")
     except Exception as e:
         logging.error(f"Job failed for {zip_code}: {str(e)}")
+        await _complete_status(zip_code, state="failed", error=str(e))
+        raise
+
+# Durable job queue
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", "4"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Lower runs first. Within a class, owners share the queue by weighted fair queuing.
+JOB_PRIORITY = {"interactive": 0, "batch": 1, "background": 2}
+# Worker slots per process that only interactive jobs may take
+JOB_INTERACTIVE_RESERVED_SLOTS = int(os.environ.get("JOB_INTERACTIVE_RESERVED_SLOTS", "1"))
+JOB_DEFAULT_DURATION_SECONDS = float(os.environ.get("JOB_DEFAULT_DURATION_SECONDS", "180"))
+# Jobs that only enqueue and watch other jobs. They run outside the worker slots, so a driver
+# waiting on its children can never hold the slots those children need.
+JOB_DRIVER_KINDS = ["zip_batch"]
+JOB_MAX_DRIVERS = int(os.environ.get("JOB_MAX_DRIVERS", "16"))
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+    "zip_analysis": lambda job: _run_zip_job(job["zip_code"], job.get("sections")),
+    "zip_batch": lambda job: _run_zip_batch(job["batch_id"]),
+}
+# Run after a job is cancelled on request, to settle whatever state it was updating
+JOB_CANCEL_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+    "zip_analysis": lambda job: _mark_status_cancelled(job["zip_code"]),
+}
+
+class JobQueue:
+    """Mongo-backed job queue shared by every worker process.
+
+    Workers claim the next queued job (or a running job whose lease has expired) with a
+    single find_one_and_update, then renew the lease with heartbeats while the handler
+    runs. A job whose worker dies is picked up again once its lease lapses, up to
+    JOB_MAX_ATTEMPTS times.
+
+    Jobs are ordered by priority class, then by a self-clocked fair queuing finish tag:
+    an owner's next job starts where their previous one finished (or at the class's clock,
+    if later) and advances by cost / weight. A brokerage enqueuing hundreds of ZIPs
+    therefore interleaves with single agents instead of running ahead of them.
+
+    Driver jobs (JOB_DRIVER_KINDS) are claimed by a separate loop and do not occupy a
+    worker slot; up to JOB_MAX_DRIVERS of them run per process.
+    """
+
+    def __init__(self, collection, accounts, lease_seconds: float = JOB_LEASE_SECONDS, poll_seconds: float = JOB_POLL_SECONDS,
+                 concurrency: int = JOB_WORKER_CONCURRENCY, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 reserved_slots: int = JOB_INTERACTIVE_RESERVED_SLOTS, max_drivers: int = JOB_MAX_DRIVERS):
+        self.collection = collection
+        self.accounts = accounts
+        self.reserved_slots = min(reserved_slots, concurrency - 1)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.max_drivers = max_drivers
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._workers: List[asyncio.Task] = []
+        self._active: Dict[str, asyncio.Task] = {}
+        self._active_priority: Dict[str, int] = {}
+        self._drivers: set = set()
+        self._cancelling: set = set()
+        self.stats = {"claimed": 0, "reclaimed": 0, "completed": 0, "failed": 0, "cancelled": 0, "lost_leases": 0}
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("state", 1), ("priority", 1), ("virtual_finish", 1), ("created_at", 1)])
+        await self.collection.create_index([("state", 1), ("lease_expires_at", 1)])
+        await self.collection.create_index([("state", 1), ("kind", 1), ("finished_at", -1)])
+
+    async def _clock(self, priority: int) -> float:
+        doc = await self.accounts.find_one({"_id": f"clock:{priority}"})
+        return (doc or {}).get("value", 0.0)
+
+    async def _finish_tag(self, priority: int, owner: str, cost: float, weight: float) -> float:
+        """Charge an owner for a job and return its virtual finish tag."""
+        clock = await self._clock(priority)
+        account = await self.accounts.find_one_and_update(
+            {"_id": f"owner:{priority}:{owner}"},
+            [{"$set": {"value": {"$add": [{"$max": [{"$ifNull": ["$value", 0]}, clock]}, cost / max(weight, 0.01)]}}}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return account["value"]
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None, priority: str = "interactive",
+                      owner: str = "anonymous", weight: float = 1.0, cost: float = 1.0) -> str:
+        now = datetime.utcnow()
+        job_id = job_id or str(uuid.uuid4())
+        level = JOB_PRIORITY[priority]
+        await self.collection.insert_one({
+            "_id": job_id,
+            "kind": kind,
+            **payload,
+            "priority": level,
+            "owner": owner,
+            "virtual_finish": await self._finish_tag(level, owner, cost, weight),
+            "state": "queued",
+            "attempts": 0,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        return job_id
+
+    async def join(self, job_id: str, joiner: str):
+        """Record another caller (user id, "anonymous" or "batch:<id>") waiting on an existing job."""
+        await self.collection.update_one({"_id": job_id}, {"$addToSet": {"joined_by": joiner}})
+
+    async def promote(self, job_id: str, priority: str = "interactive"):
+        """Move a still-queued job up to `priority`, e.g. when a user asks for a ZIP being pre-warmed."""
+        level = JOB_PRIORITY[priority]
+        await self.collection.update_one(
+            {"_id": job_id, "state": "queued", "priority": {"$gt": level}},
+            {"$set": {"priority": level, "virtual_finish": await self._clock(level), "updated_at": datetime.utcnow()}},
+        )
+
+    async def claim(self, drivers: bool = False) -> Optional[Dict[str, Any]]:
+        """Claim the next job for a worker slot, or with drivers=True the next driver job."""
+        now = datetime.utcnow()
+        query: Dict[str, Any] = {
+            "kind": {"$in" if drivers else "$nin": JOB_DRIVER_KINDS},
+            "attempts": {"$lt": self.max_attempts},
+            "cancel_requested": {"$ne": True},
+            "$or": [
+                {"state": "queued"},
+                {"state": "running", "lease_expires_at": {"$lt": now}},
+            ],
+        }
+        non_interactive = sum(1 for level in self._active_priority.values() if level > JOB_PRIORITY["interactive"])
+        if not drivers and non_interactive >= self.concurrency - self.reserved_slots:
+            query["priority"] = JOB_PRIORITY["interactive"]
+        job = await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "state": "running",
+                    "worker_id": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", 1), ("virtual_finish", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            if job.get("virtual_finish") is not None:
+                await self.accounts.update_one(
+                    {"_id": f"clock:{job.get('priority', 0)}"},
+                    {"$max": {"value": job["virtual_finish"]}},
+                    upsert=True,
+                )
+            self.stats["claimed"] += 1
+            if job["attempts"] > 1:
+                self.stats["reclaimed"] += 1
+                logging.warning(f"Reclaimed job {job['_id']} ({job['kind']}), attempt {job['attempts']}")
+        return job
+
+    async def _heartbeat(self, job_id: str, runner: asyncio.Task):
+        while not runner.done():
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = datetime.utcnow()
+            result = await self.collection.update_one(
+                {"_id": job_id, "worker_id": self.worker_id, "state": "running", "cancel_requested": {"$ne": True}},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now}},
+            )
+            if result.matched_count == 0:
+                job = await self.collection.find_one({"_id": job_id, "worker_id": self.worker_id}, {"cancel_requested": 1})
+                if job and job.get("cancel_requested"):
+                    logging.info(f"Cancelling job {job_id} on request")
+                    self._cancelling.add(job_id)
+                else:
+                    self.stats["lost_leases"] += 1
+                    logging.warning(f"Lost lease on job {job_id}; stopping local run")
+                runner.cancel()
+                return
+
+    async def request_cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a job. Returns "cancelled" if it was still queued, "cancelling" if it is running
+        (the worker stops it at its next heartbeat, or now if it runs in this process), or None
+        if the job is not active."""
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"_id": job_id, "state": "queued"},
+            {"$set": {"state": "cancelled", "finished_at": now, "updated_at": now}},
+        )
+        if result.modified_count:
+            self.stats["cancelled"] += 1
+            return "cancelled"
+        result = await self.collection.update_one(
+            {"_id": job_id, "state": "running"},
+            {"$set": {"cancel_requested": True, "updated_at": now}},
+        )
+        if not result.matched_count:
+            return None
+        runner = self._active.get(job_id)
+        if runner is not None:
+            self._cancelling.add(job_id)
+            runner.cancel()
+        return "cancelling"
+
+    async def _finish(self, job_id: str, state: str, error: Optional[str] = None):
+        await self.collection.update_one(
+            {"_id": job_id, "worker_id": self.worker_id},
+            {"$set": {"state": state, "error": error, "lease_expires_at": None, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+        )
+
+    async def _typical_duration(self, kind: str) -> float:
+        """Median run time of the last 20 finished jobs of this kind."""
+        durations = []
+        cursor = self.collection.find(
+            {"state": "done", "kind": kind, "finished_at": {"$ne": None}, "started_at": {"$ne": None}},
+            {"started_at": 1, "finished_at": 1},
+        ).sort("finished_at", -1).limit(20)
+        async for job in cursor:
+            durations.append((job["finished_at"] - job["started_at"]).total_seconds())
+        return _percentile(sorted(durations), 50) if durations else JOB_DEFAULT_DURATION_SECONDS
+
+    async def position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Place in line and estimated start time for a queued job, or None if it is not queued.
+
+        The estimate assumes the jobs ahead and the ones running drain through the busy
+        workers in waves of one typical job duration.
+        """
+        job = await self.collection.find_one({"_id": job_id, "state": "queued"})
+        if not job:
+            return None
+        level, tag = job.get("priority", 0), job.get("virtual_finish", 0)
+        ahead = await self.collection.count_documents({
+            "state": "queued",
+            "kind": {"$nin": JOB_DRIVER_KINDS},
+            "attempts": {"$lt": self.max_attempts},
+            "$or": [
+                {"priority": {"$lt": level}},
+                {"priority": level, "virtual_finish": {"$lt": tag}},
+                {"priority": level, "virtual_finish": tag, "created_at": {"$lt": job["created_at"]}},
+            ],
+        })
+        running = await self.collection.count_documents({"state": "running", "kind": {"$nin": JOB_DRIVER_KINDS}})
+        slots = max(running, self.concurrency)
+        wait_seconds = ((ahead + running) // slots) * await self._typical_duration(job["kind"])
+        priority = next(name for name, value in JOB_PRIORITY.items() if value == level)
+        return {
+            "position": ahead + 1,
+            "priority": priority,
+            "estimated_start_at": datetime.utcnow() + timedelta(seconds=wait_seconds),
+        }
+
+    async def run(self, job: Dict[str, Any]):
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            await self._finish(job["_id"], "failed", f"No handler for job kind '{job['kind']}'")
+            return
+        runner = asyncio.create_task(handler(job))
+        self._active[job["_id"]] = runner
+        if job["kind"] not in JOB_DRIVER_KINDS:
+            self._active_priority[job["_id"]] = job.get("priority", JOB_PRIORITY["interactive"])
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"], runner))
+        try:
+            await runner
+            await self._finish(job["_id"], "done")
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            if job["_id"] in self._cancelling:
+                await self._finish(job["_id"], "cancelled")
+                on_cancel = JOB_CANCEL_HANDLERS.get(job["kind"])
+                if on_cancel is not None:
+                    await on_cancel(job)
+                self.stats["cancelled"] += 1
+            elif not heartbeat.done():
+                raise
+        except Exception as e:
+            logging.error(f"Job {job['_id']} failed: {str(e)}")
+            await self._finish(job["_id"], "failed", str(e))
+            self.stats["failed"] += 1
+        finally:
+            heartbeat.cancel()
+            self._active.pop(job["_id"], None)
+            self._active_priority.pop(job["_id"], None)
+            self._cancelling.discard(job["_id"])
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logging.warning(f"Job claim failed: {str(e)}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            await self.run(job)
+
+    async def _driver_worker(self):
+        while True:
+            job = None
+            if len(self._drivers) < self.max_drivers:
+                try:
+                    job = await self.claim(drivers=True)
+                except Exception as e:
+                    logging.warning(f"Driver job claim failed: {str(e)}")
+            if job is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            task = asyncio.create_task(self.run(job))
+            self._drivers.add(task)
+            task.add_done_callback(self._drivers.discard)
+
+    async def start(self):
+        await self.ensure_indexes()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+            self._workers.append(asyncio.create_task(self._driver_worker()))
+
+    async def stop(self):
+        """Stop polling and hand any in-flight jobs back to the queue for another worker."""
+        for task in [*self._workers, *self._drivers]:
+            task.cancel()
+        self._workers = []
+        for job_id in list(self._active):
+            await self.collection.update_one(
+                {"_id": job_id, "worker_id": self.worker_id},
+                {"$set": {"state": "queued", "worker_id": None, "lease_expires_at": None, "updated_at": datetime.utcnow()},
+                 "$inc": {"attempts": -1}},
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "reserved_interactive_slots": self.reserved_slots,
+            "active": len(self._active),
+            "drivers": len(self._drivers),
+            "active_by_priority": dict(Counter(self._active_priority.values())),
+            **self.stats,
+        }
+
+job_queue = JobQueue(db.analysis_jobs, db.analysis_queue_accounts)
+
+# Orphaned status reaper
+REAPER_INTERVAL_SECONDS = float(os.environ.get("REAPER_INTERVAL_SECONDS", "120"))
+# An active status untouched this long is checked against its job
+STATUS_STALE_SECONDS = float(os.environ.get("STATUS_STALE_SECONDS", "600"))
+REAPER_REQUEUE = os.environ.get("REAPER_REQUEUE", "true").lower() == "true"
+
+class StatusReaper:
+    """Settle analysis_status documents left active by jobs that will never update them again.
+
+    A stale status is left alone while its job is still queued or holds a live lease, and
+    while an expired lease can still be reclaimed by the queue. If the job no longer exists
+    (e.g. it was started before the durable queue), the ZIP is requeued under the same
+    job_id. Otherwise the status is marked failed, or cancelled if a cancel was pending.
+    """
+
+    def __init__(self, queue: JobQueue, interval_seconds: float = REAPER_INTERVAL_SECONDS,
+                 stale_seconds: float = STATUS_STALE_SECONDS, requeue: bool = REAPER_REQUEUE):
+        self.queue = queue
+        self.interval_seconds = interval_seconds
+        self.stale_seconds = stale_seconds
+        self.requeue = requeue
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"sweeps": 0, "requeued": 0, "failed": 0, "cancelled": 0}
+
+    async def _settle(self, status_doc: Dict[str, Any]) -> Optional[str]:
+        now = datetime.utcnow()
+        zip_code = status_doc["zip_code"]
+        job = await self.queue.collection.find_one({"_id": status_doc.get("job_id")}) if status_doc.get("job_id") else None
+        if job and job["state"] == "running" and (job.get("lease_expires_at") or now) > now:
+            # A live lease means a worker is still running it, whatever the attempt count
+            return None
+        if job and job["attempts"] < self.queue.max_attempts:
+            if job["state"] == "queued":
+                return None
+            if job["state"] == "running" and not job.get("cancel_requested"):
+                return None
+        if job and job["state"] in ("queued", "running"):
+            settled_state = "cancelled" if job.get("cancel_requested") else "failed"
+            await self.queue.collection.update_one(
+                {"_id": job["_id"], "state": job["state"]},
+                {"$set": {"state": settled_state, "error": "Abandoned by reaper", "lease_expires_at": None, "finished_at": now, "updated_at": now}},
+            )
+            job["state"] = settled_state
+        if status_doc["state"] == "cancelling" or (job and job["state"] == "cancelled"):
+            await _mark_status_cancelled(zip_code)
+            return "cancelled"
+        if job is None and self.requeue and status_doc.get("job_id"):
+            await db.analysis_status.update_one(
+                {"zip_code": zip_code, "job_id": status_doc["job_id"]},
+                {"$set": {"state": "queued", "updated_at": now}},
+            )
+            await self.queue.enqueue("zip_analysis", {"zip_code": zip_code}, job_id=status_doc["job_id"], priority="background", owner="reaper")
+            return "requeued"
+        error = (job or {}).get("error") or "Analysis stopped responding"
         await db.analysis_status.update_one(
-            {"zip_code": zip_code},
-            {"$set": {"state": "failed", "error": str(e), "updated_at": datetime.utcnow()}},
+            {"zip_code": zip_code, "state": status_doc["state"]},
+            {"$set": {"state": "failed", "error": error, "updated_at": now}},
         )
+        return "failed"
+
+    async def sweep(self) -> Dict[str, int]:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        settled = Counter()
+        async for status_doc in db.analysis_status.find({"state": {"$in": ACTIVE_JOB_STATES}, "updated_at": {"$lt": cutoff}}):
+            try:
+                outcome = await self._settle(status_doc)
+            except Exception as e:
+                logging.warning(f"Reaper could not settle {status_doc['zip_code']}: {str(e)}")
+                continue
+            if outcome:
+                settled[outcome] += 1
+                self.stats[outcome] += 1
+                logging.warning(f"Reaper {outcome} stale analysis for {status_doc['zip_code']}")
+        self.stats["sweeps"] += 1
+        return dict(settled)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.warning(f"Reaper sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"interval_seconds": self.interval_seconds, "stale_seconds": self.stale_seconds, "requeue": self.requeue, **self.stats}
+
+status_reaper = StatusReaper(job_queue)
+
+# Batch territory analysis
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "5"))
+BATCH_POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS", "5"))
+
+async def _set_batch_item(batch_id: str, zip_code: str, **fields):
+    update = {f"items.{zip_code}.{key}": value for key, value in fields.items()}
+    update["updated_at"] = datetime.utcnow()
+    await db.analysis_batches.update_one({"_id": batch_id}, {"$set": update})
+
+async def _run_zip_batch(batch_id: str):
+    """Drive a batch's pending ZIPs through the job queue, at most `concurrency` at a time.
+
+    Each ZIP is claimed like an interactive start (joining a job already in flight) and polled
+    until its status settles. Items already settled are skipped, so a reclaimed batch resumes.
+    Runs as a driver job outside the worker slots, so only the child jobs take slots.
+    """
+    batch = await db.analysis_batches.find_one({"_id": batch_id})
+    if not batch:
+        raise RuntimeError(f"Batch {batch_id} not found")
+    await db.analysis_batches.update_one({"_id": batch_id}, {"$set": {"state": "running", "updated_at": datetime.utcnow()}})
+    semaphore = asyncio.Semaphore(batch.get("concurrency") or BATCH_CONCURRENCY)
+
+    async def drive(zip_code: str):
+        async with semaphore:
+            status_doc, created = await _claim_status(zip_code)
+            if created:
+                await job_queue.enqueue("zip_analysis", {"zip_code": zip_code}, job_id=status_doc["job_id"],
+                                        priority="batch", owner=batch["created_by"])
+            else:
+                await job_queue.join(status_doc["job_id"], f"batch:{batch_id}")
+            await _set_batch_item(batch_id, zip_code, state="running", job_id=status_doc["job_id"])
+            while True:
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+                current = await db.analysis_status.find_one({"zip_code": zip_code}, {"state": 1, "error": 1})
+                if current and current["state"] not in ACTIVE_JOB_STATES:
+                    break
+            await _set_batch_item(batch_id, zip_code, state=current["state"], error=current.get("error"))
+
+    pending = [z for z, item in batch["items"].items() if item["state"] in ("pending", "running")]
+    await asyncio.gather(*[drive(z) for z in pending])
+    await db.analysis_batches.update_one(
+        {"_id": batch_id},
+        {"$set": {"state": "done", "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+    )
+
+# Pre-warming owned territories
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "true").lower() == "true"
+PREWARM_INTERVAL_SECONDS = float(os.environ.get("PREWARM_INTERVAL_SECONDS", "600"))
+PREWARM_LEAD_HOURS = float(os.environ.get("PREWARM_LEAD_HOURS", "24"))
+# Off-peak window in UTC hours, [start, end); may wrap past midnight
+PREWARM_WINDOW_START_HOUR = int(os.environ.get("PREWARM_WINDOW_START_HOUR", "6"))
+PREWARM_WINDOW_END_HOUR = int(os.environ.get("PREWARM_WINDOW_END_HOUR", "11"))
+# LLM calls (one per section refreshed) pre-warming may spend per UTC day, across all workers
+PREWARM_DAILY_LLM_BUDGET = int(os.environ.get("PREWARM_DAILY_LLM_BUDGET", "400"))
+
+class PrewarmScheduler:
+    """Refresh owned territories shortly before their sections go stale.
+
+    Every PREWARM_INTERVAL_SECONDS during the off-peak window it finds owned ZIPs with a
+    section expiring within PREWARM_LEAD_HOURS, soonest first, and enqueues refresh jobs for
+    that tick's share of them: the due list divided by the ticks left in the window. That
+    spreads the work across the window instead of bursting at its start. Jobs go through
+    _claim_status like interactive starts. Each section is charged against a daily LLM budget
+    kept in Mongo, so several worker processes share one budget.
+    """
+
+    def __init__(self, collection, interval_seconds: float = PREWARM_INTERVAL_SECONDS, lead_hours: float = PREWARM_LEAD_HOURS,
+                 window_start_hour: int = PREWARM_WINDOW_START_HOUR, window_end_hour: int = PREWARM_WINDOW_END_HOUR,
+                 daily_budget: int = PREWARM_DAILY_LLM_BUDGET):
+        self.collection = collection
+        self.interval_seconds = interval_seconds
+        self.lead_seconds = lead_hours * 3600
+        self.window_start_hour = window_start_hour
+        self.window_end_hour = window_end_hour
+        self.daily_budget = daily_budget
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.stats = {"ticks": 0, "enqueued": 0, "sections": 0, "over_budget": 0}
+
+    def _window_end(self, now: datetime) -> Optional[datetime]:
+        """End of the off-peak window containing `now`, or None outside it."""
+        start, end, hour = self.window_start_hour, self.window_end_hour, now.hour
+        inside = start <= hour < end if start < end else (hour >= start or hour < end)
+        if not inside:
+            return None
+        window_end = now.replace(hour=end, minute=0, second=0, microsecond=0)
+        return window_end if window_end > now else window_end + timedelta(days=1)
+
+    async def _reserve(self, calls: int) -> bool:
+        """Atomically charge `calls` against today's budget; False if it would overspend."""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": day, "used": {"$lte": self.daily_budget - calls}},
+                {"$inc": {"used": calls}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _refund(self, calls: int):
+        """Return calls reserved for a job that was never enqueued."""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        await self.collection.update_one({"_id": day}, {"$inc": {"used": -calls}, "$set": {"updated_at": datetime.utcnow()}})
+
+    async def due_territories(self) -> List[tuple]:
+        """(expires_at, zip_code, sections) for owned ZIPs needing a refresh within the lead time."""
+        owned = set()
+        async for user in db.users.find({"owned_territories.0": {"$exists": True}}, {"owned_territories": 1}):
+            owned.update(user.get("owned_territories", []))
+        due = []
+        for zip_code in owned:
+            analysis = await _latest_analysis(zip_code)
+            sections = _stale_sections(analysis, self.lead_seconds)
+            if not sections:
+                continue
+            freshness = _section_freshness(analysis) if analysis else {}
+            expires_at = min((freshness[s]["expires_at"] for s in sections if s in freshness), default=datetime.utcnow())
+            due.append((expires_at, zip_code, sections))
+        due.sort()
+        return due
+
+    async def tick(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        self.stats["ticks"] += 1
+        window_end = self._window_end(now)
+        if window_end is None:
+            self.last_run = {"at": now, "in_window": False}
+            return self.last_run
+        due = await self.due_territories()
+        ticks_left = max(1, math.ceil((window_end - now).total_seconds() / self.interval_seconds))
+        quota = math.ceil(len(due) / ticks_left)
+        enqueued = []
+        for _, zip_code, sections in due[:quota]:
+            if not await self._reserve(len(sections)):
+                self.stats["over_budget"] += 1
+                break
+            status_doc, created = await _claim_status(zip_code)
+            if created:
+                await job_queue.enqueue("zip_analysis", {"zip_code": zip_code, "sections": sections}, job_id=status_doc["job_id"],
+                                        priority="background", owner="prewarm", cost=len(sections))
+                enqueued.append(zip_code)
+                self.stats["enqueued"] += 1
+                self.stats["sections"] += len(sections)
+            else:
+                # A job is already active for this ZIP, so nothing was enqueued against the reservation
+                await self._refund(len(sections))
+        self.last_run = {"at": now, "in_window": True, "due": len(due), "quota": quota, "enqueued": enqueued}
+        if enqueued:
+            logging.info(f"Pre-warm enqueued {len(enqueued)} of {len(due)} due territories")
+        return self.last_run
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logging.warning(f"Pre-warm tick failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def snapshot(self) -> Dict[str, Any]:
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        budget = await self.collection.find_one({"_id": day}) or {}
+        return {
+            "enabled": self._task is not None,
+            "window_utc": [self.window_start_hour, self.window_end_hour],
+            "lead_hours": self.lead_seconds / 3600,
+            "daily_budget": self.daily_budget,
+            "budget_used_today": budget.get("used", 0),
+            "last_run": self.last_run,
+            **self.stats,
+        }
+
+prewarm_scheduler = PrewarmScheduler(db.prewarm_budget)
 
 # Authentication Endpoints
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -1380,82 +2944,13 @@ async def check_zip_availability(zip_data: dict):
     if not re.match(r'^\d{5}(-\d{4})?$', zip_code):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ZIP code format")
     
-    # Initialize location variables
-    city = "Unknown"
-    state = "Unknown"
-    county = "Unknown County"
-    latitude = 0.0
-    longitude = 0.0
-    geocoding_source = "unknown"
-    
-    try:
-        # First try geocoding service
-        geolocator = Nominatim(user_agent="zip-intel-generator", timeout=5)
-        location = geolocator.geocode(f"{zip_code}, USA")
-        
-        if location:
-            # Parse location data from geocoded address
-            address_parts = location.address.split(', ')
-            print(f"Geocoded address: {location.address}")  # Debug log
-            
-            # Common US state abbreviations and full names
-            us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
-            us_state_names = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico', 'New York', 'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming']
-            
-            # Parse the geocoded address (format: ZIP, City, County, State, Country)
-            for i, part in enumerate(address_parts):
-                part = part.strip()
-                
-                # Look for state (abbreviation or full name)
-                if any(state_abbr in part for state_abbr in us_states) or any(state_name in part for state_name in us_state_names):
-                    state = part
-                    # Convert full state name to abbreviation for consistency
-                    if part == 'Georgia':
-                        state = 'GA'
-                    elif part == 'California':
-                        state = 'CA'
-                    elif part == 'New York':
-                        state = 'NY'
-                    elif part == 'Texas':
-                        state = 'TX'
-                    elif part == 'Florida':
-                        state = 'FL'
-                    # Add more as needed
-                        
-                    # City is usually before state
-                    if i >= 2:  # Skip ZIP code (index 0)
-                        city = address_parts[1].strip()  # Usually index 1 is city
-                        if i >= 3 and ('County' in address_parts[2] or 'Parish' in address_parts[2]):
-                            county = address_parts[2].strip()
-                    break
-            
-            latitude = location.latitude
-            longitude = location.longitude
-            geocoding_source = "nominatim"
-            print(f"Parsed location from Nominatim: city={city}, state={state}, county={county}")
-        else:
-            raise Exception("No results from Nominatim")
-            
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        
-        # Fallback to manual data if available
-        if zip_code in FALLBACK_ZIP_DATA:
-            fallback_data = FALLBACK_ZIP_DATA[zip_code]
-            city = fallback_data["city"]
-            state = fallback_data["state"]
-            county = fallback_data["county"]
-            latitude = fallback_data["latitude"]
-            longitude = fallback_data["longitude"]
-            geocoding_source = "fallback"
-            print(f"Using fallback data for ZIP {zip_code}: {city}, {state}")
-        else:
-            # If no fallback data available, return error
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                detail=f"Failed to lookup ZIP code location. Geocoding service unavailable and no fallback data for ZIP {zip_code}."
-            )
-    
+    location = await resolve_location(zip_code)
+    if location is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to lookup ZIP code location. Geocoding service unavailable and no fallback data for ZIP {zip_code}."
+        )
+
     # **CRITICAL FIX**: Check if ZIP is actually taken by checking user database
     user_with_zip = await users_collection.find_one({"owned_territories": zip_code})
     is_available = user_with_zip is None  # Available if no user owns it
@@ -1468,16 +2963,20 @@ async def check_zip_availability(zip_data: dict):
         random.seed(hash(zip_code))
         waitlist_count = random.randint(5, 30)
     
+    nearby_available = None
+    if not is_available and zip_index is not None:
+        nearby_available = await _nearby_available(zip_code, location["latitude"], location["longitude"], k=NEARBY_SUGGESTIONS)
+
     result = {
         "zip_code": zip_code,
         "available": is_available,
         "location_info": {
-            "city": city,
-            "state": state, 
-            "county": county,
-            "latitude": latitude,
-            "longitude": longitude,
-            "geocoding_source": geocoding_source  # Debug info
+            "city": location["city"],
+            "state": location["state"],
+            "county": location["county"] or "Unknown County",
+            "latitude": location["latitude"],
+            "longitude": location["longitude"],
+            "geocoding_source": location["source"]  # Debug info
         },
         "pricing": {
             "monthly_fee": 299,
@@ -1485,18 +2984,51 @@ async def check_zip_availability(zip_data: dict):
             "annual_discount": 0.15
         } if is_available else None,
         "waitlist_count": waitlist_count,
+        "nearby_available": nearby_available,
         "assigned_to": user_with_zip["email"] if user_with_zip else None  # Debug info
     }
-    
+
     return result
+
+@api_router.get("/zip-availability/nearby")
+async def nearby_available_zips(
+    zip_code: str,
+    k: Optional[int] = Query(None, ge=1),
+    radius_miles: Optional[float] = Query(None, gt=0),
+):
+    """Unowned ZIPs near a ZIP: the k nearest (default), or all within radius_miles."""
+    zip_code = zip_code.strip()
+    if not re.match(r'^\d{5}(-\d{4})?$', zip_code):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ZIP code format")
+    if zip_index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Nearby search needs the ZIP gazetteer")
+    if k is not None and radius_miles is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass either k or radius_miles, not both")
+    location = await resolve_location(zip_code)
+    if location is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown ZIP code {zip_code}")
+    started = time.perf_counter()
+    nearby = await _nearby_available(
+        zip_code,
+        location["latitude"],
+        location["longitude"],
+        k=min(k, NEARBY_MAX_K) if k is not None else None,
+        radius_miles=min(radius_miles, NEARBY_MAX_RADIUS_MILES) if radius_miles is not None else None,
+    )
+    return {
+        "zip_code": location["zip_code"],
+        "city": location["city"],
+        "state": location["state"],
+        "radius_miles": radius_miles,
+        "results": nearby,
+        "search_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
 async def analyze_zip_code(request: ZipAnalysisRequest, background_tasks: BackgroundTasks):
     try:
         zip_code = request.zip_code
-        existing = await db.market_intelligence.find_one({
-            "zip_code": zip_code,
-            "created_at": {"$gte": datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)},
-        })
-        if existing:
+        existing = await _latest_analysis(zip_code)
+        if existing and not _stale_sections(existing):
             return MarketIntelligence(**existing)
         svc = ZipIntelligenceService()
         location_info = await svc.get_location_info(zip_code)
@@ -1520,37 +3052,143 @@ async def analyze_zip_code(request: ZipAnalysisRequest, background_tasks: Backgr
         raise HTTPException(status_code=500, detail=f"Error generating analysis: {str(e)}")
 
 @api_router.post("/zip-analysis/start")
-async def start_zip_analysis(request: ZipAnalysisRequest):
+async def start_zip_analysis(request: ZipAnalysisRequest, current_user: Optional[dict] = Depends(get_optional_user)):
     zip_code = request.zip_code
-    existing = await db.market_intelligence.find_one({
-        "zip_code": zip_code,
-        "created_at": {"$gte": datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)},
-    })
-    if existing:
-        await db.analysis_status.update_one(
-            {"zip_code": zip_code},
-            {"$set": {"zip_code": zip_code, "state": "done", "overall_percent": 100, "updated_at": datetime.utcnow()}},
-            upsert=True,
-        )
+    if not await _stale_sections_for(zip_code):
+        done = {"zip_code": zip_code, "state": "done", "overall_percent": 100, "updated_at": datetime.utcnow()}
+        try:
+            await db.analysis_status.update_one(
+                {"zip_code": zip_code, "state": {"$nin": ACTIVE_JOB_STATES}},
+                {"$set": done},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # A pre-warm refresh is in flight; the stored analysis is still fresh, so serve it now
+            return done
         status_doc = await db.analysis_status.find_one({"zip_code": zip_code}, {"_id": 0})
         return status_doc
-    status_doc = await _init_status(zip_code)
-    asyncio.create_task(_run_zip_job(zip_code))
-    status_doc.pop('_id', None)
+    status_doc, created = await _claim_status(zip_code)
+    if created:
+        await job_queue.enqueue(
+            "zip_analysis", {"zip_code": zip_code}, job_id=status_doc["job_id"], priority="interactive",
+            owner=current_user["_id"] if current_user else "anonymous",
+            weight=current_user.get("queue_weight", 1.0) if current_user else 1.0,
+        )
+    else:
+        await job_queue.join(status_doc["job_id"], current_user["_id"] if current_user else "anonymous")
+        if status_doc.get("state") == "queued":
+            await job_queue.promote(status_doc["job_id"], "interactive")
+    if status_doc.get("state") == "queued":
+        status_doc["queue"] = await job_queue.position(status_doc["job_id"])
     return status_doc
 
+@api_router.post("/zip-analysis/{zip_code}/cancel")
+async def cancel_zip_analysis(zip_code: str, current_user: Optional[dict] = Depends(get_optional_user)):
+    """Cancel a queued or running analysis. Stages that already finished stay checkpointed.
+
+    Owners and super admins may cancel. An anonymous job can be cancelled by anyone only
+    until another start or batch joins it; after that only a super admin can cancel it.
+    """
+    status_doc = await db.analysis_status.find_one({"zip_code": zip_code}, {"_id": 0})
+    if not status_doc or status_doc.get("state") not in ACTIVE_JOB_STATES:
+        raise HTTPException(status_code=409, detail="No analysis in progress for this ZIP code")
+    job = await job_queue.collection.find_one({"_id": status_doc.get("job_id")}, {"owner": 1, "joined_by": 1})
+    owner = (job or {}).get("owner", "anonymous")
+    is_admin = bool(current_user) and current_user.get("role") == "super_admin"
+    if not is_admin:
+        if owner == "anonymous" and (job or {}).get("joined_by"):
+            raise HTTPException(status_code=403, detail="Other requests are waiting on this analysis, so it cannot be cancelled")
+        if owner != "anonymous" and (not current_user or current_user["_id"] != owner):
+            raise HTTPException(status_code=403, detail="You can only cancel analyses you started")
+    outcome = await job_queue.request_cancel(status_doc["job_id"])
+    if outcome == "cancelled":
+        await _mark_status_cancelled(zip_code)
+    elif outcome == "cancelling":
+        await db.analysis_status.update_one(
+            {"zip_code": zip_code, "job_id": status_doc["job_id"], "state": {"$in": ["queued", "running"]}},
+            {"$set": {"state": "cancelling", "updated_at": datetime.utcnow()}},
+        )
+    return await db.analysis_status.find_one({"zip_code": zip_code}, {"_id": 0})
+
 @api_router.get("/zip-analysis/status/{zip_code}")
 async def get_zip_status(zip_code: str):
     status_doc = await db.analysis_status.find_one({"zip_code": zip_code})
     if not status_doc:
         raise HTTPException(status_code=404, detail="Status not found")
     status_doc.pop('_id', None)
+    if status_doc.get("state") == "queued" and status_doc.get("job_id"):
+        status_doc["queue"] = await job_queue.position(status_doc["job_id"])
+    status_doc["llm_circuit"] = llm_breaker.snapshot()
     return status_doc
 
+@api_router.post("/zip-analysis/batch")
+async def start_zip_batch(request: ZipBatchRequest, admin_user: dict = Depends(get_admin_user)):
+    """Queue analysis for many ZIPs at once; ZIPs with a fresh analysis are skipped"""
+    now = datetime.utcnow()
+    batch_id = str(uuid.uuid4())
+    items = {}
+    for zip_code in request.zip_codes:
+        fresh = not await _stale_sections_for(zip_code)
+        items[zip_code] = {"state": "fresh" if fresh else "pending", "job_id": None, "error": None}
+    scheduled = sum(1 for item in items.values() if item["state"] == "pending")
+    batch = {
+        "_id": batch_id,
+        "state": "queued" if scheduled else "done",
+        "concurrency": request.concurrency or BATCH_CONCURRENCY,
+        "items": items,
+        "created_by": admin_user["_id"],
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db.analysis_batches.insert_one(batch)
+    if scheduled:
+        await job_queue.enqueue("zip_batch", {"batch_id": batch_id}, priority="batch", owner=admin_user["_id"])
+    return {"batch_id": batch_id, "total": len(items), "fresh": len(items) - scheduled, "scheduled": scheduled}
+
+@api_router.get("/zip-analysis/batch/{batch_id}")
+async def get_zip_batch(batch_id: str, admin_user: dict = Depends(get_admin_user)):
+    """Aggregate progress for a batch, with per-ZIP state and percent"""
+    batch = await db.analysis_batches.find_one({"_id": batch_id})
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    items = batch["items"]
+    running = [z for z, item in items.items() if item["state"] == "running"]
+    live = {}
+    if running:
+        async for doc in db.analysis_status.find({"zip_code": {"$in": running}}, {"zip_code": 1, "overall_percent": 1}):
+            live[doc["zip_code"]] = doc.get("overall_percent", 0)
+    for zip_code, item in items.items():
+        item["overall_percent"] = live.get(zip_code, 0) if item["state"] in ("pending", "running") else 100
+    counts = Counter(item["state"] for item in items.values())
+    return {
+        "batch_id": batch_id,
+        "state": batch["state"],
+        "total": len(items),
+        "counts": dict(counts),
+        "overall_percent": round(sum(item["overall_percent"] for item in items.values()) / len(items)),
+        "items": items,
+        "created_at": batch["created_at"],
+        "updated_at": batch["updated_at"],
+        "finished_at": batch.get("finished_at"),
+    }
+
+@api_router.get("/zip-analysis/{zip_code}/freshness")
+async def get_zip_freshness(zip_code: str):
+    """When each section was last generated, when it expires, and whether a refresh would redo it"""
+    analysis = await _latest_analysis(zip_code)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    sections = _section_freshness(analysis)
+    return {
+        "zip_code": zip_code,
+        "sections": sections,
+        "stale_sections": [section for section, info in sections.items() if info["stale"]],
+    }
+
 @api_router.get("/zip-analysis/{zip_code}", response_model=MarketIntelligence)
 async def get_zip_analysis(zip_code: str):
     try:
-        analysis = await db.market_intelligence.find_one({"zip_code": zip_code})
+        analysis = await _latest_analysis(zip_code)
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         return MarketIntelligence(**analysis)
@@ -1562,7 +3200,7 @@ async def get_zip_analysis(zip_code: str):
 @api_router.get("/generate-pdf/{zip_code}")
 async def generate_hidden_listings_pdf(zip_code: str):
     try:
-        analysis = await db.market_intelligence.find_one({"zip_code": zip_code})
+        analysis = await _latest_analysis(zip_code)
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
@@ -1593,7 +3231,7 @@ async def generate_hidden_listings_pdf(zip_code: str):
 @api_router.get("/content-asset/{zip_code}/{asset_type}/{asset_name}")
 async def get_content_asset(zip_code: str, asset_type: str, asset_name: str):
     try:
-        analysis = await db.market_intelligence.find_one({"zip_code": zip_code})
+        analysis = await _latest_analysis(zip_code)
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
         content_assets = analysis['content_assets']
@@ -1613,21 +3251,27 @@ async def get_content_asset(zip_code: str, asset_type: str, asset_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/zip-analysis/assets/regenerate")
-async def regenerate_assets(request: ZipAnalysisRequest):
-    """Regenerate only content assets for an existing analysis."""
+async def regenerate_assets(request: ZipAnalysisRequest, fresh: bool = False):
+    """Regenerate only content assets for an existing analysis. Pass fresh=true to bypass the LLM cache."""
     zip_code = request.zip_code
-    analysis = await db.market_intelligence.find_one({"zip_code": zip_code})
+    analysis = await _latest_analysis(zip_code)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     location_info = analysis.get('buyer_migration', {}).get('location') or {}
     try:
         svc = ZipIntelligenceService()
-        assets = await svc.generate_content_assets(zip_code, location_info)
+        assets = await svc.generate_content_assets(zip_code, location_info, use_cache=not fresh)
+        if not _is_valid_stage_result("content_assets", assets):
+            # Keep the stored assets; a failed regeneration must not replace them or reset their TTL
+            raise HTTPException(status_code=502, detail=f"Asset regeneration failed: {assets.get('error', 'no assets returned')}")
+        now = datetime.utcnow()
         await db.market_intelligence.update_one(
-            {"zip_code": zip_code},
-            {"$set": {"content_assets": assets, "updated_at": datetime.utcnow()}},
+            {"_id": analysis["_id"]},
+            {"$set": {"content_assets": assets, "section_updated_at.content_assets": now, "updated_at": now}},
         )
         return assets
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error regenerating assets: {str(e)}")
 
@@ -1635,6 +3279,137 @@ async def regenerate_assets(request: ZipAnalysisRequest):
 async def root():
     return {"message": "ZIP Intel Generator API v2.0 (buyer+seo+strategy+assets)"}
 
+@api_router.get("/health")
+async def health_check():
+    """Liveness plus upstream dependency state, so clients can avoid starting doomed jobs"""
+    database = "ok"
+    try:
+        await db.command("ping")
+    except Exception as e:
+        database = f"error: {str(e)}"
+    llm_circuit = llm_breaker.snapshot()
+    healthy = database == "ok" and llm_circuit["state"] != "open"
+    gazetteer = {"loaded": zip_gazetteer is not None, "zips": len(zip_gazetteer) if zip_gazetteer is not None else 0}
+    return {"status": "ok" if healthy else "degraded", "database": database, "llm_circuit": llm_circuit, "gazetteer": gazetteer}
+
+def _stale_prompt_stages(analysis: Dict[str, Any]) -> List[str]:
+    return [
+        stage for stage in REFRESHABLE_STAGES
+        if (analysis.get(stage) or {}).get("prompt_version") != prompt_registry.version(stage)
+    ]
+
+async def _enqueue_prompt_refresh() -> Dict[str, Any]:
+    """Queue a background zip_analysis job per ZIP whose latest analysis has stages built from
+    an outdated prompt, regenerating just those stages. ZIPs with an active job are skipped;
+    a later refresh picks them up if their stages are still outdated."""
+    seen = set()
+    enqueued, skipped = [], []
+    async for analysis in db.market_intelligence.find({}).sort("created_at", -1):
+        zip_code = analysis["zip_code"]
+        if zip_code in seen:
+            continue
+        seen.add(zip_code)
+        stages = _stale_prompt_stages(analysis)
+        if not stages:
+            continue
+        status_doc, created = await _claim_status(zip_code)
+        if not created:
+            skipped.append(zip_code)
+            continue
+        await job_queue.enqueue("zip_analysis", {"zip_code": zip_code, "sections": stages}, job_id=status_doc["job_id"],
+                                priority="background", owner="prompt_refresh", cost=len(stages))
+        enqueued.append(zip_code)
+    if enqueued:
+        logging.info(f"Prompt refresh enqueued {len(enqueued)} territories ({len(skipped)} busy)")
+    return {"enqueued": enqueued, "skipped_active": skipped}
+
+@api_router.get("/admin/prompts")
+async def get_prompt_versions(admin_user: dict = Depends(get_admin_user)):
+    """Current prompt template versions and how many territories were built from older ones"""
+    stale = {stage: 0 for stage in REFRESHABLE_STAGES}
+    seen = set()
+    projection = {"zip_code": 1, **{f"{stage}.prompt_version": 1 for stage in REFRESHABLE_STAGES}}
+    async for analysis in db.market_intelligence.find({}, projection).sort("created_at", -1):
+        if analysis["zip_code"] in seen:
+            continue
+        seen.add(analysis["zip_code"])
+        for stage in _stale_prompt_stages(analysis):
+            stale[stage] += 1
+    return {"versions": prompt_registry.versions(), "stale_territories": stale, "territories": len(seen)}
+
+@api_router.post("/admin/prompts/refresh")
+async def refresh_prompt_stages(admin_user: dict = Depends(get_admin_user)):
+    """Queue regeneration of only the stages whose prompt template changed, across all territories"""
+    queued = await _enqueue_prompt_refresh()
+    return {"message": f"Prompt refresh queued for {len(queued['enqueued'])} territories", "versions": prompt_registry.versions(), **queued}
+
+@api_router.get("/admin/llm/calls")
+async def get_llm_call_stats(hours: float = 24, zip_code: Optional[str] = None, admin_user: dict = Depends(get_admin_user)):
+    """Per-stage LLM latency percentiles and totals over the last `hours`, optionally for one ZIP.
+
+    Latency percentiles cover upstream calls that succeeded (outcome "ok") only; cache hits
+    and failed or short-circuited calls are counted separately.
+    """
+    await llm_call_log.flush()
+    since = datetime.utcnow() - timedelta(hours=hours)
+    match: Dict[str, Any] = {"created_at": {"$gte": since}}
+    if zip_code:
+        match["zip_code"] = zip_code
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$stage",
+            "calls": {"$sum": 1},
+            "latencies": {"$push": {"$cond": [{"$eq": ["$outcome", "ok"]}, "$latency_ms", None]}},
+            "retries": {"$sum": "$retries"},
+            "ok": {"$sum": {"$cond": [{"$eq": ["$outcome", "ok"]}, 1, 0]}},
+            "cached": {"$sum": {"$cond": [{"$eq": ["$outcome", "cached"]}, 1, 0]}},
+            "failed": {"$sum": {"$cond": [{"$in": ["$outcome", ["fallback", "short_circuited"]]}, 1, 0]}},
+            "prompt_chars": {"$sum": "$prompt_chars"},
+            "response_chars": {"$sum": "$response_chars"},
+            "prompt_tokens": {"$sum": {"$ifNull": ["$prompt_tokens", 0]}},
+            "completion_tokens": {"$sum": {"$ifNull": ["$completion_tokens", 0]}},
+        }},
+    ]
+    stages = {}
+    async for row in db.llm_calls.aggregate(pipeline):
+        latencies = sorted(latency for latency in row.pop("latencies") if latency is not None)
+        stage = row.pop("_id")
+        stages[stage] = {
+            **row,
+            "p50_ms": _percentile(latencies, 50) if latencies else None,
+            "p95_ms": _percentile(latencies, 95) if latencies else None,
+            "p99_ms": _percentile(latencies, 99) if latencies else None,
+            "total_ms": round(sum(latencies), 1),
+        }
+    return {"since": since, "hours": hours, "stages": stages}
+
+@api_router.get("/admin/prewarm")
+async def get_prewarm_status(admin_user: dict = Depends(get_admin_user)):
+    """Pre-warm scheduler window, budget use and the territories currently due for refresh"""
+    due = await prewarm_scheduler.due_territories()
+    return {
+        **(await prewarm_scheduler.snapshot()),
+        "due": [{"zip_code": zip_code, "expires_at": expires_at, "sections": sections} for expires_at, zip_code, sections in due],
+    }
+
+@api_router.get("/admin/llm/stats")
+async def get_llm_stats(admin_user: dict = Depends(get_admin_user)):
+    """LLM client pool, rate limiter, hedging, circuit breaker and response cache counters"""
+    pool = get_llm_pool()
+    return {
+        "pool": pool.snapshot(),
+        "limiter": pool.limiter.snapshot(),
+        "hedging": pool.hedging.snapshot(),
+        "jobs": job_queue.snapshot(),
+        "reaper": status_reaper.snapshot(),
+        "status_buffer": status_buffer.snapshot(),
+        "stage_lengths": stage_length_model.snapshot(),
+        "geocoder": geocoder.snapshot(),
+        "circuit": llm_breaker.snapshot(),
+        "cache": llm_cache.snapshot(),
+    }
+
 # Individual Platform Generation Endpoints
 @api_router.post("/generate-platform-content/{platform}")
 async def generate_platform_content(
@@ -1652,7 +3427,7 @@ async def generate_platform_content(
         raise HTTPException(status_code=403, detail="You don't own this territory")
     
     # Get stored intelligence data for this ZIP
-    analysis = await db.market_intelligence.find_one({"zip_code": zip_code})
+    analysis = await _latest_analysis(zip_code)
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found for this ZIP code")
     
@@ -1664,16 +3439,17 @@ async def generate_platform_content(
     
     # Platform-specific generation
     svc = ZipIntelligenceService()
+    use_cache = not request_data.get("fresh", False)
     
     try:
         if platform == "instagram":
-            content = await svc.generate_instagram_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy)
+            content = await svc.generate_instagram_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy, use_cache=use_cache)
         elif platform == "facebook":
-            content = await svc.generate_facebook_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy)  
+            content = await svc.generate_facebook_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy, use_cache=use_cache)  
         elif platform == "linkedin":
             content = await svc.generate_linkedin_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy)
         elif platform == "tiktok":
-            content = await svc.generate_tiktok_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy)
+            content = await svc.generate_tiktok_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy, use_cache=use_cache)
         elif platform == "youtube-shorts":
             content = await svc.generate_youtube_shorts_content(zip_code, location_info, buyer_migration, seo_social_trends, content_strategy)
         elif platform == "twitter":
@@ -1707,6 +3483,45 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_llm_pool():
+    get_llm_pool()
+    try:
+        await llm_cache.ensure_indexes()
+    except Exception as e:
+        logging.warning(f"Could not create llm_cache indexes: {str(e)}")
+    try:
+        await geo_cache.ensure_indexes()
+    except Exception as e:
+        logging.warning(f"Could not create geo_cache indexes: {str(e)}")
+    try:
+        await llm_call_log.start()
+    except Exception as e:
+        logging.warning(f"Could not start llm_calls log: {str(e)}")
+    try:
+        await _ensure_status_index()
+    except Exception as e:
+        logging.critical(f"Could not create the unique analysis_status.zip_code index: {str(e)}")
+        raise RuntimeError("analysis_status needs a unique zip_code index for atomic job claims") from e
+    try:
+        await db.analysis_checkpoints.create_index("updated_at", expireAfterSeconds=CHECKPOINT_TTL_SECONDS)
+    except Exception as e:
+        logging.warning(f"Could not create analysis_checkpoints indexes: {str(e)}")
+    try:
+        await job_queue.start()
+    except Exception as e:
+        logging.warning(f"Could not start job workers: {str(e)}")
+    status_buffer.start()
+    status_reaper.start()
+    if PREWARM_ENABLED:
+        prewarm_scheduler.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    prewarm_scheduler.stop()
+    status_reaper.stop()
+    await status_buffer.stop()
+    await job_queue.stop()
+    await llm_call_log.stop()
+    geocoder.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Offline US ZIP gazetteer: a memory-mapped, array-backed ZIP -> location table.
+
+The binary file holds one fixed-size record per possible 5-digit ZIP (00000-99999),
+so a lookup is a single array index, followed by a string table of NUL-terminated
+UTF-8 names shared between records. Opening it only maps the file; nothing is parsed
+or loaded up front.
+
+Build it from a CSV with a header row and one row per ZIP (e.g. SimpleMaps' uszips.csv):
+  python zip_gazetteer.py uszips.csv                     # writes data/zip_gazetteer.bin
+  python zip_gazetteer.py zips.tsv --out /tmp/zips.bin --longitude-col lng
+
+Columns are matched by common names (zip/zipcode, city/primary_city, state_id/state,
+county_name/county, lat/latitude, lng/lon/longitude) unless given explicitly.
+"""
+
+import argparse
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+MAGIC = b"ZIPGAZ01"
+# magic, record slots, ZIPs present, records offset, strings offset
+HEADER = struct.Struct("<8sIIII")
+SLOTS = 100000
+MISSING = 0xFFFFFFFF
+RECORD_DTYPE = np.dtype([
+    ("city", "<u4"),
+    ("state", "<u4"),
+    ("county", "<u4"),
+    ("latitude", "<f4"),
+    ("longitude", "<f4"),
+])
+# Same layout as RECORD_DTYPE, for single-record reads without numpy scalar overhead
+RECORD = struct.Struct("<IIIff")
+DEFAULT_PATH = Path(__file__).parent / "data" / "zip_gazetteer.bin"
+
+COLUMN_ALIASES = {
+    "zip": ["zip", "zipcode", "zip_code", "postal_code", "zcta5"],
+    "city": ["city", "primary_city", "place_name", "usps_city"],
+    "state": ["state_id", "state", "state_code", "state_abbr", "admin_code1"],
+    "county": ["county_name", "county", "admin_name2"],
+    "latitude": ["lat", "latitude"],
+    "longitude": ["lng", "lon", "long", "longitude"],
+}
+
+
+class ZipGazetteer:
+    """Read-only view over a gazetteer file built by build()."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slots, present, records_offset, strings_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a ZIP gazetteer file")
+        self.records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=slots, offset=records_offset)
+        self._records_offset = records_offset
+        self._strings_offset = strings_offset
+        self.size = present
+
+    @classmethod
+    def load(cls, path) -> Optional["ZipGazetteer"]:
+        """Open the gazetteer at `path`, or return None if it is missing or unreadable."""
+        if not Path(path).exists():
+            logging.info(f"No ZIP gazetteer at {path}; location lookups will use Nominatim")
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logging.warning(f"Could not open ZIP gazetteer {path}: {str(e)}")
+            return None
+
+    def _string(self, offset: int) -> str:
+        start = self._strings_offset + offset
+        return self._mm[start:self._mm.find(b"\0", start)].decode("utf-8")
+
+    def lookup(self, zip_code: str) -> Optional[Dict[str, Any]]:
+        base = zip_code.split("-")[0].strip()
+        if len(base) != 5 or not base.isdigit():
+            return None
+        city, state, county, latitude, longitude = RECORD.unpack_from(self._mm, self._records_offset + int(base) * RECORD.size)
+        if city == MISSING:
+            return None
+        return {
+            "zip_code": base,
+            "city": self._string(city),
+            "state": self._string(state),
+            "county": self._string(county) if county != MISSING else None,
+            "latitude": round(latitude, 5),
+            "longitude": round(longitude, 5),
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _resolve_columns(fieldnames: List[str], overrides: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    lowered = {name.strip().lower(): name for name in fieldnames}
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        if overrides.get(key):
+            columns[key] = overrides[key]
+            continue
+        columns[key] = next((lowered[a] for a in aliases if a in lowered), None)
+    missing = [key for key in ("zip", "city", "state", "latitude", "longitude") if not columns[key]]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)} (have: {', '.join(fieldnames)})")
+    return columns
+
+
+def build(rows: Iterable[Dict[str, str]], out_path, columns: Dict[str, Optional[str]]) -> int:
+    """Write a gazetteer file from CSV rows; returns the number of ZIPs stored.
+
+    The file is written next to `out_path` and renamed into place, so a running server
+    keeps its existing mapping until it reopens the file.
+    """
+    records = np.zeros(SLOTS, dtype=RECORD_DTYPE)
+    for field in ("city", "state", "county"):
+        records[field] = MISSING
+    strings = bytearray()
+    offsets: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        if value not in offsets:
+            offsets[value] = len(strings)
+            strings.extend(value.encode("utf-8") + b"\0")
+        return offsets[value]
+
+    present = 0
+    for row in rows:
+        zip_code = (row.get(columns["zip"]) or "").strip().split("-")[0].zfill(5)
+        city = (row.get(columns["city"]) or "").strip()
+        state = (row.get(columns["state"]) or "").strip()
+        if len(zip_code) != 5 or not zip_code.isdigit() or not city or not state:
+            continue
+        try:
+            latitude = float(row[columns["latitude"]])
+            longitude = float(row[columns["longitude"]])
+        except (TypeError, ValueError):
+            continue
+        county = (row.get(columns["county"]) or "").strip() if columns["county"] else ""
+        slot = records[int(zip_code)]
+        if slot["city"] == MISSING:
+            present += 1
+        records[int(zip_code)] = (
+            intern(city),
+            intern(state),
+            intern(county) if county else MISSING,
+            latitude,
+            longitude,
+        )
+
+    records_offset = HEADER.size
+    strings_offset = records_offset + records.nbytes
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, SLOTS, present, records_offset, strings_offset))
+        f.write(records.tobytes())
+        f.write(bytes(strings))
+    os.replace(tmp_path, out_path)
+    return present
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the memory-mapped US ZIP gazetteer from a CSV")
+    parser.add_argument("csv_path")
+    parser.add_argument("--out", default=str(DEFAULT_PATH))
+    parser.add_argument("--delimiter", default=None, help="defaults to sniffing ',' / tab")
+    for key in COLUMN_ALIASES:
+        parser.add_argument(f"--{key.replace('_', '-')}-col", dest=f"{key}_col", default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.csv_path, newline="", encoding="utf-8-sig") as f:
+        delimiter = args.delimiter or ("\t" if "\t" in f.readline() else ",")
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        columns = _resolve_columns(reader.fieldnames or [], {key: getattr(args, f"{key}_col") for key in COLUMN_ALIASES})
+        count = build(reader, args.out, columns)
+
+    size_kb = Path(args.out).stat().st_size / 1024
+    print(f"✅ Wrote {count} ZIPs to {args.out} ({size_kb:.0f} KB)")
+    sample = ZipGazetteer(args.out)
+    for zip_code in ("30126", "10001", "90210"):
+        print(f"   {zip_code}: {sample.lookup(zip_code)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+KD-tree over ZIP centroids for nearest-neighbour and radius queries.
+
+Centroids are projected onto the unit sphere as 3-D points, so straight-line (chord)
+distance between points orders them exactly as great-circle distance does, and an
+ordinary axis-aligned KD-tree gives exact answers anywhere in the US, including
+across the antimeridian for Alaska. The tree is a set of flat NumPy arrays: points
+are permuted so every node owns a contiguous slice, and each node keeps its bounding
+box for pruning. Leaves are scanned with vectorised distance computations.
+"""
+
+import heapq
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from zip_gazetteer import MISSING
+
+EARTH_RADIUS_MILES = 3958.8
+LEAF_SIZE = 32
+
+
+def _unit_vectors(latitude, longitude) -> np.ndarray:
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _chord_to_miles(chord_sq: np.ndarray) -> np.ndarray:
+    return 2 * np.arcsin(np.minimum(np.sqrt(chord_sq) / 2, 1.0)) * EARTH_RADIUS_MILES
+
+
+def _miles_to_chord_sq(miles: float) -> float:
+    theta = min(miles / EARTH_RADIUS_MILES, np.pi)
+    return float((2 * np.sin(theta / 2)) ** 2)
+
+
+class ZipSpatialIndex:
+    """Immutable KD-tree over ZIP centroids.
+
+    `zips` are integer ZIP codes (e.g. 30126); an optional `exclude` boolean mask in the
+    tree's point order (see mask_for) hides points such as owned territories from a
+    query without rebuilding the tree.
+    """
+
+    def __init__(self, zips, latitude, longitude, leaf_size: int = LEAF_SIZE):
+        zips = np.asarray(zips, dtype=np.int64)
+        points = _unit_vectors(latitude, longitude)
+        order = np.arange(len(zips))
+        lo, hi, left, right, box_min, box_max = [], [], [], [], [], []
+
+        def build(start: int, stop: int) -> int:
+            node = len(lo)
+            segment = points[order[start:stop]]
+            lo.append(start)
+            hi.append(stop)
+            left.append(-1)
+            right.append(-1)
+            box_min.append(segment.min(axis=0))
+            box_max.append(segment.max(axis=0))
+            if stop - start > leaf_size:
+                dim = int(np.argmax(box_max[node] - box_min[node]))
+                mid = (stop - start) // 2
+                split = np.argpartition(segment[:, dim], mid)
+                order[start:stop] = order[start:stop][split]
+                left[node] = build(start, start + mid)
+                right[node] = build(start + mid, stop)
+            return node
+
+        if len(zips):
+            build(0, len(zips))
+        self.zips = zips[order]
+        self.points = points[order]
+        self._lo = np.array(lo, dtype=np.int64)
+        self._hi = np.array(hi, dtype=np.int64)
+        self._left = np.array(left, dtype=np.int64)
+        self._right = np.array(right, dtype=np.int64)
+        self._box_min = np.array(box_min).reshape(-1, 3)
+        self._box_max = np.array(box_max).reshape(-1, 3)
+        self._slot = np.full(100000, -1, dtype=np.int64)
+        self._slot[self.zips] = np.arange(len(self.zips))
+
+    @classmethod
+    def from_gazetteer(cls, gazetteer) -> "ZipSpatialIndex":
+        """Index every ZIP present in a ZipGazetteer's record array."""
+        records = gazetteer.records
+        zips = np.flatnonzero(records["city"] != MISSING)
+        return cls(zips, records["latitude"][zips], records["longitude"][zips])
+
+    def __len__(self) -> int:
+        return len(self.zips)
+
+    def mask_for(self, zip_codes) -> np.ndarray:
+        """Boolean mask (in tree order) that is True for the given ZIP codes."""
+        mask = np.zeros(len(self.zips), dtype=bool)
+        ints = [int(z) for z in zip_codes if len(z) == 5 and z.isdigit()]
+        if ints:
+            slots = self._slot[np.array(ints, dtype=np.int64)]
+            mask[slots[slots >= 0]] = True
+        return mask
+
+    def _box_distance_sq(self, node: int, q: np.ndarray) -> float:
+        gap = np.maximum(self._box_min[node] - q, 0) + np.maximum(q - self._box_max[node], 0)
+        return float(gap @ gap)
+
+    def _leaf(self, node: int, q: np.ndarray, exclude: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        idx = np.arange(self._lo[node], self._hi[node])
+        if exclude is not None:
+            idx = idx[~exclude[idx]]
+        diff = self.points[idx] - q
+        return idx, np.einsum("ij,ij->i", diff, diff)
+
+    def nearest(self, latitude: float, longitude: float, k: int,
+                exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """The k closest (zip, miles) pairs, nearest first."""
+        if not len(self.zips) or k <= 0:
+            return []
+        q = _unit_vectors(latitude, longitude)
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance_sq, index)
+        frontier = [(0.0, 0)]
+        while frontier:
+            bound, node = heapq.heappop(frontier)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            if self._left[node] < 0:
+                idx, dist = self._leaf(node, q, exclude)
+                for i, d in zip(idx.tolist(), dist.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                continue
+            for child in (self._left[node], self._right[node]):
+                heapq.heappush(frontier, (self._box_distance_sq(child, q), int(child)))
+        best.sort(reverse=True)
+        idx = np.array([i for _, i in best], dtype=np.int64)
+        miles = _chord_to_miles(np.array([-d for d, _ in best]))
+        return [(int(z), float(m)) for z, m in zip(self.zips[idx], miles)]
+
+    def within(self, latitude: float, longitude: float, radius_miles: float,
+               exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Every (zip, miles) pair within radius_miles, nearest first."""
+        if not len(self.zips) or radius_miles < 0:
+            return []
+        q = _unit_vectors(latitude, longitude)
+        limit = _miles_to_chord_sq(radius_miles)
+        found_idx, found_dist = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance_sq(node, q) > limit:
+                continue
+            if self._left[node] < 0:
+                idx, dist = self._leaf(node, q, exclude)
+                keep = dist <= limit
+                found_idx.append(idx[keep])
+                found_dist.append(dist[keep])
+                continue
+            stack.extend((int(self._left[node]), int(self._right[node])))
+        if not found_idx:
+            return []
+        idx = np.concatenate(found_idx)
+        dist = np.concatenate(found_dist)
+        order = np.argsort(dist, kind="stable")
+        miles = _chord_to_miles(dist[order])
+        return [(int(z), float(m)) for z, m in zip(self.zips[idx[order]], miles)]
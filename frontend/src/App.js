@@ -1,4 +1,4 @@
-import React, { useState, useMemo, useEffect, useRef } from "react";
+import React, { useState, useMemo, useEffect } from "react";
 import { 
   Loader2, 
   MapPin, 
@@ -23,6 +23,7 @@ import RegistrationForm from "./components/RegistrationForm";
 import LoginForm from "./components/LoginForm";
 import ProtectedRoute from "./components/ProtectedRoute";
 import AdminDashboard from "./components/AdminDashboard";
+import MarkdownRenderer from "./components/MarkdownRenderer";
 import { AuthProvider, useAuth } from "./contexts/AuthContext";
 import axios from "axios";
 import "./App.css";
@@ -46,13 +47,13 @@ const Alert = ({ variant = "default", children }) => { const variants = { defaul
 
 // Five tasks now: location -> buyer -> seo -> content strategy -> assets
 const TASK_PLAN = [
-  { id: "location", title: "Task 1 - ZIP Code Analysis", range: [0, 15] },
-  { id: "buyer_migration", title: "Task 2 - Buyer Migration Intelligence", range: [15, 40] },
-  { id: "seo_social_trends", title: "Task 3 - SEO & Social Media Trends", range: [40, 70] },
-  { id: "content_strategy", title: "Task 4 - Content Strategy", range: [70, 90] },
-  { id: "content_assets", title: "Task 5 - Content Assets", range: [90, 100] },
+  { id: "location", title: "Task 1 - ZIP Code Analysis" },
+  { id: "buyer_migration", title: "Task 2 - Buyer Migration Intelligence" },
+  { id: "seo_social_trends", title: "Task 3 - SEO & Social Media Trends" },
+  { id: "content_strategy", title: "Task 4 - Content Strategy" },
+  { id: "content_assets", title: "Task 5 - Content Assets" },
 ];
-function computeTaskProgress(overall) { const progress = {}; TASK_PLAN.forEach((t) => { const [start, end] = t.range; let pct = 0; if (overall >= end) pct = 100; else if (overall <= start) pct = 0; else pct = Math.round(((overall - start) / (end - start)) * 100); const status = pct === 0 ? "pending" : pct === 100 ? "done" : "running"; progress[t.id] = { percent: Math.max(0, Math.min(100, pct)), status, title: t.title }; }); return progress; }
+function taskProgressFromStatus(tasks = {}, overall = 0) { const progress = {}; TASK_PLAN.forEach((t) => { const task = tasks[t.id] || (overall >= 100 ? { percent: 100, status: "done" } : {}); progress[t.id] = { percent: Math.max(0, Math.min(100, task.percent || 0)), status: task.status || "pending", title: t.title }; }); return progress; }
 
 export default function ZipIntelApp() {
   return (
@@ -79,13 +80,12 @@ function AppContent() {
   const [showPreviousZipsModal, setShowPreviousZipsModal] = useState(false);
   const [analysisZip, setAnalysisZip] = useState("");
   const [analysisLoading, setAnalysisLoading] = useState(false);
+  const [partialPreview, setPartialPreview] = useState("");
+  const [queueInfo, setQueueInfo] = useState(null);
   const [previousZips, setPreviousZips] = useState(() => {
     const stored = localStorage.getItem('zipintel:previous_zips');
     return stored ? JSON.parse(stored) : [];
   });
-  const progressTimerRef = useRef(null);
-
-  useEffect(() => { setTaskProgress(computeTaskProgress(overallProgress)); }, [overallProgress]);
 
   // Attempt to hydrate analysis from last zip on deep links
   useEffect(() => {
@@ -122,9 +122,6 @@ function AppContent() {
 
   function validateZip(z) { return /^\d{5}(-\d{4})?$/.test(z.trim()); }
 
-  function startProgressSimulation() { setOverallProgress(0); if (progressTimerRef.current) clearInterval(progressTimerRef.current); progressTimerRef.current = setInterval(() => { setOverallProgress((prev) => { if (prev >= 99) return prev; return Math.min(99, prev + 3); }); }, 800); }
-  function stopProgressSimulation(finalValue = 100) { if (progressTimerRef.current) clearInterval(progressTimerRef.current); progressTimerRef.current = null; setOverallProgress(finalValue); }
-
   async function runZipAnalysis() {
     if (!validateZip(analysisZip)) { 
       setError("Please enter a valid ZIP code (e.g., 12345 or 12345-6789)"); 
@@ -135,17 +132,25 @@ function AppContent() {
     setError(""); 
     setSuccess(""); 
     setAnalysisData(null);
-    startProgressSimulation();
+    setPartialPreview("");
+    setQueueInfo(null);
+    setOverallProgress(0);
+    setTaskProgress(taskProgressFromStatus());
     
     try {
-      await axios.post(`${API}/zip-analysis/start`, { zip_code: analysisZip.trim() });
-      let done = false;
+      const { data: started } = await axios.post(`${API}/zip-analysis/start`, { zip_code: analysisZip.trim() });
+      let done = started.state === 'done' || started.state === 'partial';
       while (!done) {
         await new Promise(res => setTimeout(res, 2000));
         const { data: status } = await axios.get(`${API}/zip-analysis/status/${analysisZip.trim()}`);
         setOverallProgress(status.overall_percent || 0);
-        if (status.state === 'done') { done = true; break; }
+        setTaskProgress(taskProgressFromStatus(status.tasks, status.overall_percent));
+        setPartialPreview(status.tasks?.buyer_migration?.analysis_content || "");
+        setQueueInfo(status.state === 'queued' ? status.queue : null);
+        if (status.state === 'done' || status.state === 'partial') { done = true; break; }
         if (status.state === 'failed') { throw new Error(status.error || 'Analysis failed'); }
+        if (status.state === 'cancelled') { throw new Error('Analysis cancelled'); }
+        if (status.llm_circuit?.state === 'open') { throw new Error('AI analysis is temporarily unavailable. Please try again in a few minutes.'); }
       }
       const response = await axios.get(`${API}/zip-analysis/${analysisZip.trim()}`);
       setAnalysisData(response.data);
@@ -170,19 +175,27 @@ function AppContent() {
       setPreviousZips(newPreviousZips);
       localStorage.setItem('zipintel:previous_zips', JSON.stringify(newPreviousZips));
       
-      stopProgressSimulation(100);
+      setOverallProgress(100);
+      setTaskProgress(taskProgressFromStatus({}, 100));
       setSuccess("Analysis completed successfully!");
       setShowAnalysisModal(false);
       navigate('/dashboard');
     } catch (err) {
       console.error("Analysis error:", err); 
-      stopProgressSimulation(overallProgress); 
       setError(err.response?.data?.detail || err.message || "Failed to generate analysis. Please try again.");
     } finally { 
       setAnalysisLoading(false); 
     }
   }
 
+  async function cancelZipAnalysis() {
+    try {
+      await axios.post(`${API}/zip-analysis/${analysisZip.trim()}/cancel`);
+    } catch (err) {
+      setError(err.response?.data?.detail || "Could not cancel the analysis");
+    }
+  }
+
   function onSubmitAnalysis(e) { 
     e.preventDefault(); 
     runZipAnalysis(); 
@@ -269,6 +282,18 @@ function AppContent() {
           
           {error && (<Alert variant="error">{error}</Alert>)}
           
+          {analysisLoading && queueInfo && (
+            <Alert>
+              Queued: position {queueInfo.position}, expected to start around {new Date(queueInfo.estimated_start_at + 'Z').toLocaleTimeString()}
+            </Alert>
+          )}
+          
+          {analysisLoading && partialPreview && (
+            <div className="max-h-64 overflow-y-auto rounded-xl border border-neutral-200 bg-neutral-50 p-4 text-sm">
+              <MarkdownRenderer content={partialPreview} />
+            </div>
+          )}
+          
           <div className="flex gap-3">
             <Button 
               type="submit" 
@@ -290,7 +315,7 @@ function AppContent() {
             <Button 
               type="button" 
               variant="outline" 
-              onClick={() => setShowAnalysisModal(false)}
+              onClick={analysisLoading ? cancelZipAnalysis : () => setShowAnalysisModal(false)}
             >
               Cancel
             </Button>
@@ -502,9 +527,23 @@ function AppContent() {
           </Button>
         </div>
         
-        <p className="text-xs text-neutral-500 mt-4">
-          💡 Tip: Try nearby ZIP codes - they might be available!
-        </p>
+        {result.nearby_available?.length ? (
+          <div className="mt-6 text-left">
+            <p className="text-sm font-semibold text-neutral-900 mb-2">Available nearby</p>
+            <div className="space-y-2">
+              {result.nearby_available.map((nearby) => (
+                <div key={nearby.zip_code} className="flex items-center justify-between bg-white rounded-lg px-4 py-2 border border-orange-200 text-sm">
+                  <span className="font-medium text-neutral-900">{nearby.zip_code} · {nearby.city}, {nearby.state}</span>
+                  <span className="text-neutral-500">{nearby.distance_miles} mi</span>
+                </div>
+              ))}
+            </div>
+          </div>
+        ) : (
+          <p className="text-xs text-neutral-500 mt-4">
+            💡 Tip: Try nearby ZIP codes - they might be available!
+          </p>
+        )}
       </CardContent>
     </Card>
   );
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request LlmChat construction vs. the shared LlmClientPool.
+
+Measures
+  1. per-call client setup overhead (building a chat object for every call)
+  2. prompt-size growth across the four analysis stages of one ZIP job
+
+The old path reused one LlmChat for all four stages, so every stage re-sent the
+previous prompts and responses as history. The pooled path sends each stage as a
+stateless single-turn request.
+
+Usage:
+  python llm_pool_benchmark.py            # offline: setup overhead + prompt growth estimate
+  python llm_pool_benchmark.py --live     # also time real upstream calls (needs OPENAI_API_KEY)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "zip_intel_benchmark")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+server.llm_cache = server.LlmResponseCache(collection=None)
+
+CHARS_PER_TOKEN = 4
+TYPICAL_RESPONSE_CHARS = 6000
+ZIP_CODE = "30126"
+LOCATION = {"city": "Mableton", "state": "GA"}
+
+
+class RecordingPool(server.LlmClientPool):
+    """Pool that records what would be sent upstream and returns a canned response."""
+
+    def __init__(self):
+        super().__init__(api_key="benchmark")
+        self.prompts = []
+
+    async def send(self, prompt, stage="adhoc", system_message=server.LLM_SYSTEM_MESSAGE, on_partial=None, sent=None):
+        self.prompts.append(system_message + prompt)
+        return "x" * TYPICAL_RESPONSE_CHARS
+
+
+def _legacy_service_setup():
+    """What the old ZipIntelligenceService.__init__ built: one LlmChat per service."""
+    return server.LlmChat(
+        api_key="benchmark",
+        session_id=f"zipintel-{server.uuid.uuid4()}",
+        system_message=server.LLM_SYSTEM_MESSAGE,
+    ).with_model("openai", "gpt-5")
+
+
+def _time_ms(fn, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) * 1000 / n
+
+
+def bench_setup_overhead(n=200, stages=4):
+    print("\n1️⃣ Client setup overhead per ZIP job")
+    pool = server.LlmClientPool(api_key="benchmark")
+    before_ms = _time_ms(_legacy_service_setup, n)
+    service_ms = _time_ms(lambda: server.ZipIntelligenceService(llm=pool), n)
+    chat_ms = _time_ms(lambda: pool._new_chat(server.LLM_SYSTEM_MESSAGE), n)
+    after_ms = service_ms + stages * chat_ms
+
+    print(f"   Before: one LlmChat per service:          {before_ms:.3f} ms per job")
+    print(f"   After:  service + {stages} per-call chats:     {after_ms:.3f} ms per job "
+          f"({service_ms:.3f} + {stages} x {chat_ms:.3f})")
+    print(f"   Difference: {after_ms - before_ms:+.3f} ms per job")
+
+
+async def bench_prompt_growth():
+    print("\n2️⃣ Prompt size per stage for one ZIP job")
+    pool = RecordingPool()
+    svc = server.ZipIntelligenceService(llm=pool)
+    await svc.generate_buyer_migration_intel(ZIP_CODE, LOCATION)
+    await svc.generate_seo_social_trends(ZIP_CODE, LOCATION)
+    await svc.generate_content_strategy(ZIP_CODE, LOCATION)
+    await svc.generate_content_assets(ZIP_CODE, LOCATION)
+
+    stages = ["buyer_migration", "seo_social_trends", "content_strategy", "content_assets"]
+    history = 0
+    old_total = new_total = 0
+    print(f"   {'stage':<20}{'before (tokens)':>18}{'after (tokens)':>18}")
+    for stage, prompt in zip(stages, pool.prompts):
+        old_tokens = (history + len(prompt)) // CHARS_PER_TOKEN
+        new_tokens = len(prompt) // CHARS_PER_TOKEN
+        print(f"   {stage:<20}{old_tokens:>18}{new_tokens:>18}")
+        old_total += old_tokens
+        new_total += new_tokens
+        history += len(prompt) + TYPICAL_RESPONSE_CHARS
+    print(f"   {'total':<20}{old_total:>18}{new_total:>18}")
+    print(f"   Prompt tokens saved per job: {old_total - new_total} ({(1 - new_total / old_total) * 100:.0f}%)")
+
+
+async def bench_live(n=3):
+    print("\n3️⃣ Live upstream calls")
+    if not os.environ.get("OPENAI_API_KEY"):
+        print("   ⚠️ OPENAI_API_KEY not set, skipping")
+        return
+    pool = server.get_llm_pool()
+    for i in range(n):
+        started = time.perf_counter()
+        await pool.send("Reply with the single word: ok")
+        print(f"   call {i + 1}: {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(f"   Pool stats: {pool.snapshot()}")
+
+
+def main():
+    print("🔍 LLM client pool benchmark")
+    print("=" * 60)
+    bench_setup_overhead()
+    asyncio.run(bench_prompt_growth())
+    if "--live" in sys.argv:
+        asyncio.run(bench_live())
+
+
+if __name__ == "__main__":
+    main()
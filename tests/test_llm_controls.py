@@ -0,0 +1,157 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import llm_controls  # noqa: E402
+from llm_controls import AdaptiveRateLimiter, CircuitBreaker, HedgingPolicy, _is_rate_limit_error  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_controls.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_success()
+    assert breaker.failures == 0
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    assert breaker.stats == {"opened": 1, "short_circuited": 1}
+
+
+def test_breaker_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow_request()
+    clock.now += 1
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_breaker_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats["opened"] == 2
+    assert breaker.snapshot()["retry_in_seconds"] == 30
+
+
+def test_breaker_abandoned_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+    breaker.abandon()
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+
+
+def test_limiter_shrinks_on_rate_limit_and_regrows():
+    async def run():
+        limiter = AdaptiveRateLimiter(requests_per_minute=600, burst=100, max_concurrency=8)
+        await limiter.acquire("buyer_migration")
+        await limiter.release("rate_limited")
+        assert limiter.limit == 4
+        assert limiter.rate == pytest.approx(5.0)
+        await limiter.acquire("buyer_migration")
+        await limiter.release("rate_limited")
+        assert limiter.limit == 2
+        assert limiter.rate == pytest.approx(2.5)
+        # Errors other than rate limits leave the limits alone
+        await limiter.acquire("buyer_migration")
+        await limiter.release("error")
+        assert limiter.limit == 2
+        grown = []
+        for _ in range(200):
+            limiter.tokens = limiter.burst  # pace only by concurrency here
+            await limiter.acquire("buyer_migration")
+            await limiter.release("ok")
+            grown.append(limiter.limit)
+        assert grown == sorted(grown)
+        assert limiter.limit == 8
+        assert limiter.rate == pytest.approx(limiter.max_rate)
+        snapshot = limiter.snapshot()
+        assert snapshot["rate_limited"] == 2
+        assert snapshot["stage_waits"]["buyer_migration"]["count"] == 203
+
+    asyncio.run(run())
+
+
+def test_limiter_bounds_concurrency():
+    async def run():
+        limiter = AdaptiveRateLimiter(requests_per_minute=6000, burst=100, max_concurrency=2)
+        await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.05)
+        assert not third.done()
+        assert limiter.waiting == 1
+        await limiter.release("ok")
+        await asyncio.wait_for(third, 1)
+        assert limiter.in_flight == 2
+
+    asyncio.run(run())
+
+
+def test_rate_limit_errors_are_classified_from_exceptions():
+    class RateLimitError(Exception):
+        pass
+
+    class HttpError(Exception):
+        def __init__(self, status_code):
+            super().__init__("upstream error")
+            self.status_code = status_code
+
+    assert _is_rate_limit_error(HttpError(429))
+    assert not _is_rate_limit_error(HttpError(500))
+    assert _is_rate_limit_error(RateLimitError("slow down"))
+    assert _is_rate_limit_error(RuntimeError("Too Many Requests"))
+    assert not _is_rate_limit_error(RuntimeError("connection reset"))
+
+
+def test_hedging_waits_for_samples_and_respects_budget():
+    policy = HedgingPolicy(enabled=True, percentile=95, budget=0.1, min_samples=20, window=100)
+    for i in range(19):
+        policy.record("seo_social_trends", 1.0 + i / 100)
+    assert policy.hedge_delay("seo_social_trends") is None
+    policy.record("seo_social_trends", 5.0)
+    assert policy.hedge_delay("seo_social_trends") == 5.0
+    assert policy.hedge_delay("content_strategy") is None
+
+    policy.stats["calls"] = 10
+    assert policy.try_acquire()
+    assert not policy.try_acquire()
+    assert policy.stats["fired"] == 1 and policy.stats["denied_budget"] == 1
+    assert HedgingPolicy(enabled=False, min_samples=1).hedge_delay("seo_social_trends") is None
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from prompt_templates import PromptRegistry, PromptTemplate  # noqa: E402
+
+
+def test_render_fills_fields():
+    template = PromptTemplate("greeting", "Market report for {city_name}, {state_name} ({zip_code}).")
+    assert template.fields == {"city_name", "state_name", "zip_code"}
+    assert template.render(city_name="Mableton", state_name="GA", zip_code="30126", unused=1) == (
+        "Market report for Mableton, GA (30126)."
+    )
+
+
+def test_render_keeps_escaped_braces_and_rejects_missing_values():
+    template = PromptTemplate("json", 'Reply as {{"city": "{city_name}"}}')
+    assert template.render(city_name="Austell") == 'Reply as {"city": "Austell"}'
+    with pytest.raises(KeyError, match="city_name"):
+        template.render()
+
+
+def test_version_tracks_text():
+    a = PromptTemplate("a", "Analyse {zip_code}")
+    assert PromptTemplate("b", "Analyse {zip_code}").version == a.version
+    assert PromptTemplate("a", "Analyse {zip_code} in depth").version != a.version
+    assert len(a.version) == 12
+
+
+def test_registry_loads_directory(tmp_path):
+    (tmp_path / "buyer_migration.txt").write_text("Buyers moving to {city_name}", encoding="utf-8")
+    (tmp_path / "content_assets.txt").write_text("Assets for {zip_code}", encoding="utf-8")
+    (tmp_path / "notes.md").write_text("not a prompt", encoding="utf-8")
+    registry = PromptRegistry(tmp_path)
+    assert sorted(registry.versions()) == ["buyer_migration", "content_assets"]
+    assert registry.render("content_assets", zip_code="30126") == "Assets for 30126"
+    assert registry.version("buyer_migration") == registry.templates["buyer_migration"].version
+    assert registry.version("missing") is None
+
+
+def test_shipped_prompts_load():
+    registry = PromptRegistry(Path(__file__).resolve().parent.parent / "backend" / "prompts")
+    assert {"buyer_migration", "seo_social_trends", "content_strategy", "content_assets"} <= set(registry.versions())
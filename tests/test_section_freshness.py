@@ -0,0 +1,55 @@
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from section_freshness import section_freshness, stale_sections  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 12, 0)
+TTL_DAYS = {"buyer_migration": 21, "seo_social_trends": 3, "content_strategy": 7}
+
+
+def _valid(section, result):
+    return bool(result) and "error" not in result
+
+
+def _analysis(**ages_days):
+    return {
+        "created_at": NOW - timedelta(days=30),
+        "section_updated_at": {section: NOW - timedelta(days=age) for section, age in ages_days.items()},
+        **{section: {"analysis_content": "..."} for section in TTL_DAYS},
+    }
+
+
+def test_no_analysis_means_every_section_is_stale():
+    assert stale_sections(None, TTL_DAYS, _valid, now=NOW) == list(TTL_DAYS)
+
+
+def test_sections_expire_on_their_own_ttl():
+    analysis = _analysis(buyer_migration=10, seo_social_trends=4, content_strategy=1)
+    freshness = section_freshness(analysis, TTL_DAYS, _valid, now=NOW)
+    assert freshness["buyer_migration"]["expires_at"] == NOW + timedelta(days=11)
+    assert [s for s, info in freshness.items() if info["stale"]] == ["seo_social_trends"]
+    assert stale_sections(analysis, TTL_DAYS, _valid, now=NOW) == ["seo_social_trends"]
+
+
+def test_lead_time_includes_sections_about_to_expire():
+    analysis = _analysis(buyer_migration=20.5, seo_social_trends=1, content_strategy=1)
+    assert stale_sections(analysis, TTL_DAYS, _valid, now=NOW) == []
+    assert stale_sections(analysis, TTL_DAYS, _valid, lead_seconds=24 * 3600, now=NOW) == ["buyer_migration"]
+
+
+def test_invalid_results_are_stale_regardless_of_age():
+    analysis = _analysis(buyer_migration=0, seo_social_trends=0, content_strategy=0)
+    analysis["content_strategy"] = {"error": "upstream failed"}
+    assert stale_sections(analysis, TTL_DAYS, _valid, now=NOW) == ["content_strategy"]
+
+
+def test_missing_section_timestamps_fall_back_to_created_at():
+    analysis = _analysis(seo_social_trends=1)
+    analysis["created_at"] = NOW - timedelta(days=10)
+    freshness = section_freshness(analysis, TTL_DAYS, _valid, now=NOW)
+    assert freshness["buyer_migration"]["updated_at"] == NOW - timedelta(days=10)
+    assert not freshness["buyer_migration"]["stale"]
+    assert freshness["content_strategy"]["stale"]
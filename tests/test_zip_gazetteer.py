@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from zip_gazetteer import ZipGazetteer, _resolve_columns, build  # noqa: E402
+
+ROWS = [
+    {"zip": "30126", "city": "Mableton", "state_id": "GA", "county_name": "Cobb", "lat": "33.8176", "lng": "-84.5816"},
+    {"zip": "02101", "city": "Boston", "state_id": "MA", "county_name": "Suffolk", "lat": "42.3601", "lng": "-71.0589"},
+    {"zip": "99501", "city": "Anchorage", "state_id": "AK", "county_name": "", "lat": "61.2181", "lng": "-149.9003"},
+    {"zip": "30127", "city": "Powder Springs", "state_id": "GA", "county_name": "Cobb", "lat": "33.8695", "lng": "-84.6838"},
+    {"zip": "1234", "city": "", "state_id": "XX", "county_name": "", "lat": "0", "lng": "0"},
+    {"zip": "55555", "city": "Nowhere", "state_id": "MN", "county_name": "", "lat": "n/a", "lng": "0"},
+]
+
+
+def _build(tmp_path):
+    path = tmp_path / "zips.bin"
+    count = build(ROWS, path, _resolve_columns(list(ROWS[0]), {}))
+    return count, ZipGazetteer(path)
+
+
+def test_build_and_lookup_round_trip(tmp_path):
+    count, gazetteer = _build(tmp_path)
+    assert count == 4
+    assert len(gazetteer) == 4
+
+    place = gazetteer.lookup("30126")
+    assert place == {
+        "zip_code": "30126",
+        "city": "Mableton",
+        "state": "GA",
+        "county": "Cobb",
+        "latitude": 33.8176,
+        "longitude": -84.5816,
+    }
+    assert gazetteer.lookup("02101")["city"] == "Boston"
+    assert gazetteer.lookup("99501")["county"] is None
+    # Shared strings are interned once but resolve for every record
+    assert gazetteer.lookup("30127")["county"] == "Cobb"
+
+
+def test_lookup_normalises_and_rejects_input(tmp_path):
+    _, gazetteer = _build(tmp_path)
+    assert gazetteer.lookup("30126-1234")["zip_code"] == "30126"
+    assert gazetteer.lookup(" 30126 ")["city"] == "Mableton"
+    assert gazetteer.lookup("10001") is None
+    assert gazetteer.lookup("55555") is None
+    assert gazetteer.lookup("abcde") is None
+    assert gazetteer.lookup("301") is None
+
+
+def test_records_array_matches_lookup(tmp_path):
+    _, gazetteer = _build(tmp_path)
+    record = gazetteer.records[30126]
+    assert abs(float(record["latitude"]) - 33.8176) < 1e-4
+    assert abs(float(record["longitude"]) + 84.5816) < 1e-4
+
+
+def test_load_missing_file_returns_none(tmp_path):
+    assert ZipGazetteer.load(tmp_path / "missing.bin") is None
+
+
+def test_load_rejects_foreign_file(tmp_path):
+    path = tmp_path / "not_a_gazetteer.bin"
+    path.write_bytes(b"\0" * 64)
+    assert ZipGazetteer.load(path) is None
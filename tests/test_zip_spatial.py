@@ -0,0 +1,94 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from zip_gazetteer import ZipGazetteer, _resolve_columns, build  # noqa: E402
+from zip_spatial import EARTH_RADIUS_MILES, ZipSpatialIndex  # noqa: E402
+
+
+def _haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def centroids():
+    rng = np.random.default_rng(7)
+    n = 5000
+    zips = rng.choice(100000, n, replace=False)
+    latitude = rng.uniform(19, 65, n)
+    longitude = rng.uniform(-170, -66, n)
+    owned = rng.choice(zips, 500, replace=False)
+    return zips, latitude, longitude, owned
+
+
+def _brute_force(centroids, lat, lon):
+    zips, latitude, longitude, owned = centroids
+    miles = _haversine_miles(lat, lon, latitude, longitude)
+    available = ~np.isin(zips, owned)
+    return zips, miles, available
+
+
+def test_nearest_matches_brute_force_with_exclude_mask(centroids):
+    zips, latitude, longitude, owned = centroids
+    index = ZipSpatialIndex(zips, latitude, longitude)
+    exclude = index.mask_for([f"{z:05d}" for z in owned])
+    rng = np.random.default_rng(11)
+    for lat, lon in zip(rng.uniform(25, 48, 25), rng.uniform(-120, -70, 25)):
+        all_zips, miles, available = _brute_force(centroids, lat, lon)
+        expected = np.argsort(np.where(available, miles, np.inf), kind="stable")[:10]
+        got = index.nearest(lat, lon, 10, exclude)
+        assert [z for z, _ in got] == list(all_zips[expected])
+        assert np.allclose([m for _, m in got], miles[expected], atol=1e-6)
+
+
+def test_within_matches_brute_force_with_exclude_mask(centroids):
+    zips, latitude, longitude, owned = centroids
+    index = ZipSpatialIndex(zips, latitude, longitude)
+    exclude = index.mask_for([f"{z:05d}" for z in owned])
+    rng = np.random.default_rng(13)
+    for lat, lon in zip(rng.uniform(25, 48, 25), rng.uniform(-120, -70, 25)):
+        all_zips, miles, available = _brute_force(centroids, lat, lon)
+        got = index.within(lat, lon, 150, exclude)
+        assert {z for z, _ in got} == set(all_zips[(miles <= 150) & available])
+        distances = [m for _, m in got]
+        assert distances == sorted(distances)
+
+
+def test_nearest_without_mask_includes_the_query_point(centroids):
+    zips, latitude, longitude, _ = centroids
+    index = ZipSpatialIndex(zips, latitude, longitude)
+    zip_code, miles = index.nearest(latitude[0], longitude[0], 1)[0]
+    assert zip_code == zips[0]
+    assert miles == pytest.approx(0, abs=1e-6)
+
+
+def test_degenerate_queries(centroids):
+    zips, latitude, longitude, _ = centroids
+    index = ZipSpatialIndex(zips, latitude, longitude)
+    assert index.nearest(40, -90, 0) == []
+    assert index.within(40, -90, -1) == []
+    assert len(index.nearest(40, -90, len(zips) + 10)) == len(zips)
+    empty = ZipSpatialIndex([], [], [])
+    assert len(empty) == 0
+    assert empty.nearest(40, -90, 5) == []
+    assert empty.within(40, -90, 50) == []
+
+
+def test_from_gazetteer_indexes_present_zips(tmp_path):
+    rows = [
+        {"zip": "30126", "city": "Mableton", "state_id": "GA", "lat": "33.8176", "lng": "-84.5816"},
+        {"zip": "30127", "city": "Powder Springs", "state_id": "GA", "lat": "33.8695", "lng": "-84.6838"},
+        {"zip": "30168", "city": "Austell", "state_id": "GA", "lat": "33.7812", "lng": "-84.5963"},
+    ]
+    path = tmp_path / "zips.bin"
+    build(rows, path, _resolve_columns(list(rows[0]), {}))
+    index = ZipSpatialIndex.from_gazetteer(ZipGazetteer(path))
+    assert len(index) == 3
+    nearby = index.nearest(33.8176, -84.5816, 3, index.mask_for(["30126"]))
+    assert [z for z, _ in nearby] == [30168, 30127]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for /api/zip-analysis/start single-flight claims.
+
+Fires N simultaneous start requests for one ZIP and checks that
+  1. every caller gets the same job_id, and
+  2. once the job finishes, each analysis stage made exactly one LLM call for that ZIP
+     (needs super admin credentials for /api/admin/llm/calls).
+
+Usage:
+  python zip_start_stress_test.py [ZIP] [N] [admin_email admin_password]
+"""
+
+import requests
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = "https://territory-hub-2.preview.emergentagent.com"
+API_URL = f"{BASE_URL}/api"
+PIPELINE_STAGES = ["buyer_migration", "seo_social_trends", "content_strategy", "content_assets"]
+TERMINAL_STATES = ("done", "partial", "failed", "cancelled")
+
+
+def start(zip_code):
+    response = requests.post(f"{API_URL}/zip-analysis/start", json={"zip_code": zip_code}, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for_job(zip_code, timeout=1200):
+    started = time.time()
+    while time.time() - started < timeout:
+        status = requests.get(f"{API_URL}/zip-analysis/status/{zip_code}", timeout=15).json()
+        print(f"   ⏳ {status.get('state')} {status.get('overall_percent')}%")
+        if status.get("state") in TERMINAL_STATES:
+            return status
+        time.sleep(10)
+    return None
+
+
+def llm_calls_for_zip(zip_code, email, password):
+    login = requests.post(f"{API_URL}/auth/login", json={"email": email, "password": password}, timeout=15)
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    response = requests.get(f"{API_URL}/admin/llm/calls", params={"hours": 0.5, "zip_code": zip_code}, headers=headers, timeout=30)
+    response.raise_for_status()
+    return response.json()["stages"]
+
+
+def main():
+    zip_code = sys.argv[1] if len(sys.argv) > 1 else "94105"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    admin = sys.argv[3:5] if len(sys.argv) > 4 else None
+
+    print(f"🔍 Firing {n} simultaneous /zip-analysis/start requests for ZIP {zip_code}")
+    print("=" * 60)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        responses = list(pool.map(start, [zip_code] * n))
+
+    states = {r.get("state") for r in responses}
+    if states == {"done"} and all(r.get("overall_percent") == 100 for r in responses):
+        print(f"⚠️ ZIP {zip_code} has no stale sections (every section is within its TTL), so no job ran; pick another ZIP")
+        return 1
+
+    job_ids = {r.get("job_id") for r in responses}
+    if len(job_ids) == 1:
+        print(f"✅ All {n} callers share job_id {job_ids.pop()}")
+    else:
+        print(f"❌ Expected one job_id, got {len(job_ids)}: {job_ids}")
+        return 1
+
+    if not admin:
+        print("ℹ️ No admin credentials given; skipping LLM call count check")
+        return 0
+
+    print("\n⏳ Waiting for the job to finish...")
+    final = wait_for_job(zip_code)
+    if not final or final.get("state") != "done":
+        print(f"❌ Job did not finish cleanly: {final}")
+        return 1
+
+    stages = llm_calls_for_zip(zip_code, *admin)
+    failed = False
+    for stage in PIPELINE_STAGES:
+        calls = stages.get(stage, {}).get("calls", 0)
+        ok = calls == 1
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {stage}: {calls} LLM call(s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())